@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import tempfile
+
+from utils.benchmark import (
+    RESOLUTIONS,
+    StubDetector,
+    build_processor,
+    format_report,
+    run_benchmark,
+    synthetic_video_for,
+)
+
+# Resolution of the footage each pipeline was written for
+SCRIPTS = {
+    "vehicleDetectionyolo": "4k",
+    "vehicleDetectionyolo_withslicer": "4k",
+    "vehicleDetectionrb": "1080p",
+    "vehicleDetectionrb_withslicer": "4k",
+    "vehicleDetectionrb_aux": "1080p",
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Per-stage benchmark of the traffic flow pipelines on synthetic "
+        "video, with a stub detector in place of the model"
+    )
+
+    parser.add_argument(
+        "--scripts",
+        nargs="+",
+        default=list(SCRIPTS),
+        choices=list(SCRIPTS),
+        help="Pipelines to benchmark",
+    )
+    parser.add_argument(
+        "--frames", default=300, help="Length of the synthetic videos", type=int
+    )
+    parser.add_argument(
+        "--resolution",
+        default=None,
+        choices=sorted(RESOLUTIONS),
+        help="Resolution of the synthetic videos (default: the one each script was "
+        "written for)",
+    )
+    parser.add_argument(
+        "--seed", default=0, help="Seed of the synthetic traffic", type=int
+    )
+    parser.add_argument(
+        "--video_dir",
+        default=None,
+        help="Directory where synthetic videos are cached (default: a temporary one)",
+        type=str,
+    )
+    parser.add_argument(
+        "--stub_latency",
+        default=0.0,
+        help="Milliseconds the stub detector spends per image",
+        type=float,
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Only count vehicles: skip annotation and encoding",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Run decoding, inference, tracking and annotation as concurrent stages",
+    )
+    parser.add_argument(
+        "--writer",
+        default="ffmpeg",
+        choices=["ffmpeg", "cv2"],
+        help="Encode the output video with an ffmpeg process (falls back to OpenCV "
+        "when ffmpeg is not installed) or with OpenCV",
+    )
+    parser.add_argument(
+        "--batch_size",
+        default=1,
+        help="Number of frames sent to the detector in a single call",
+        type=int,
+    )
+    parser.add_argument(
+        "--roi_margin",
+        default=None,
+        help="Restrict inference to the zones plus this many pixels",
+        type=int,
+    )
+    parser.add_argument(
+        "--detect_stride",
+        default=1,
+        help="Run the detector on every N-th frame and predict tracks in between",
+        type=int,
+    )
+    parser.add_argument(
+        "--adaptive_stride",
+        action="store_true",
+        help="Lower the detection stride while the scene is moving",
+    )
+    parser.add_argument(
+        "--motion_gate",
+        action="store_true",
+        help="Only run the detector on moving areas and around recent detections",
+    )
+    parser.add_argument(
+        "--process_scale",
+        default=1.0,
+        help="Resize frames by this factor right after decoding",
+        type=float,
+    )
+    parser.add_argument(
+        "--json_path",
+        default=None,
+        help="Write the results of every pipeline to this JSON file",
+        type=str,
+    )
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_dir = args.video_dir or work_dir
+        os.makedirs(video_dir, exist_ok=True)
+        results = {}
+        for script in args.scripts:
+            resolution_wh = RESOLUTIONS[args.resolution or SCRIPTS[script]]
+            source_video_path = synthetic_video_for(
+                script, video_dir, args.frames, resolution_wh, args.seed
+            )
+            processor = build_processor(
+                script,
+                source_video_path,
+                StubDetector(latency=args.stub_latency / 1000),
+                target_video_path=os.path.join(work_dir, f"{script}_annotated.mp4"),
+                headless=args.headless,
+                counts_path=os.path.join(work_dir, f"{script}_counts.jsonl"),
+                pipeline=args.pipeline,
+                writer=args.writer,
+                batch_size=args.batch_size,
+                roi_margin=args.roi_margin,
+                detect_stride=args.detect_stride,
+                adaptive_stride=args.adaptive_stride,
+                process_scale=args.process_scale,
+                motion_gate=args.motion_gate,
+            )
+            results[script] = run_benchmark(processor)
+            print(format_report(script, results[script]))
+
+    if args.json_path:
+        with open(args.json_path, "w") as json_file:
+            json.dump({"config": vars(args), "results": results}, json_file, indent=2)
@@ -0,0 +1,126 @@
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from utils.inference_client import InferenceServerClient  # noqa: E402
+
+FAILING_VALUE = 250
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Stand-in for an inference server: answers every image with its mean
+    value after a random delay, so responses come back out of order, and
+    fails at once on images of `FAILING_VALUE`, which otherwise take
+    `slow_delay`. Keeps the number of requests it handles at once.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, slow_delay: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.slow_delay = slow_delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        buffer = np.frombuffer(base64.b64decode(payload["image"]["value"]), np.uint8)
+        value = round(float(cv2.imdecode(buffer, cv2.IMREAD_COLOR).mean()))
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if value == FAILING_VALUE:
+                self.respond(500, {"message": "failed"})
+                return
+            time.sleep(server.slow_delay or random.uniform(0.0, 0.05))
+            self.respond(200, {"value": value, "predictions": []})
+        except OSError:
+            # The client went away, e.g. its request was cancelled
+            pass
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def respond(self, status: int, body: dict) -> None:
+        encoded = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**kwargs) -> StandInServer:
+        server = StandInServer(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def images(values):
+    return [np.full((32, 32, 3), value, dtype=np.uint8) for value in values]
+
+
+def test_results_in_image_order_within_in_flight_limit(serve):
+    server = serve()
+    client = InferenceServerClient(server.url, "model/1", max_in_flight=3)
+    try:
+        values = list(range(0, 200, 5))
+        results = client.infer(images(values))
+    finally:
+        client.close()
+    assert [result["value"] for result in results] == values
+    assert 1 < server.max_in_flight <= 3
+
+
+def test_failed_request_cancels_the_others(serve):
+    server = serve(slow_delay=5.0)
+    client = InferenceServerClient(server.url, "model/1", max_in_flight=4)
+    try:
+        started = time.perf_counter()
+        with pytest.raises(Exception):
+            client.infer(images([10, 20, FAILING_VALUE, 30, 40, 50]))
+        assert time.perf_counter() - started < 2.0
+
+        async def outstanding():
+            await asyncio.sleep(0.1)
+            current = asyncio.current_task()
+            return [task for task in asyncio.all_tasks() if task is not current]
+
+        assert client._run(outstanding()) == []
+    finally:
+        client.close()
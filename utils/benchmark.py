@@ -0,0 +1,206 @@
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+import supervision as sv
+
+from utils.cli import PRESETS
+from utils.metrics import Metrics, instrument
+from utils.video_processor import ZONE_IN_POLYGONS, ZONE_OUT_POLYGONS, VideoProcessor
+from utils.zones import denormalize_polygons
+
+RESOLUTIONS = {"1080p": (1920, 1080), "4k": (3840, 2160)}
+
+VEHICLE_COLORS = [(40, 40, 220), (40, 200, 40), (220, 120, 30), (30, 200, 230)]
+
+
+def make_synthetic_video(
+    path: str,
+    zones_in: List[np.ndarray],
+    zones_out: List[np.ndarray],
+    resolution_wh: Tuple[int, int],
+    total_frames: int = 300,
+    fps: int = 30,
+    seed: int = 0,
+) -> None:
+    """
+    Write a synthetic traffic video: coloured rectangles driving from the
+    center of an in zone to the center of a random out zone over a static
+    grey background. The same arguments always produce the same video.
+
+    Parameters:
+    -----------
+    path : str
+        Output video file.
+    zones_in, zones_out : List[np.ndarray]
+        Zone polygons the vehicles drive between, in frame coordinates.
+    resolution_wh : Tuple[int, int]
+        Width and height of the video.
+    total_frames : int
+        Length of the video in frames.
+    fps : int
+        Frame rate of the video.
+    seed : int
+        Seed of the routes, departure times and background texture.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = resolution_wh
+    size = np.array([width // 32, width // 48])
+
+    background = np.full((height, width, 3), 110, dtype=np.uint8)
+    noise = rng.integers(-12, 12, size=(height // 8, width // 8), dtype=np.int16)
+    noise = cv2.resize(noise.astype(np.float32), (width, height))
+    background = np.clip(background + noise[..., None], 0, 255).astype(np.uint8)
+
+    vehicles = []
+    for zone_in_id, zone_in in enumerate(zones_in):
+        departure = int(rng.integers(0, fps))
+        while departure < total_frames:
+            zone_out = zones_out[int(rng.integers(len(zones_out)))]
+            start, end = zone_in.mean(axis=0), zone_out.mean(axis=0)
+            duration = int(rng.integers(2 * fps, 4 * fps))
+            color = VEHICLE_COLORS[zone_in_id % len(VEHICLE_COLORS)]
+            vehicles.append((departure, duration, start, end, color))
+            departure += int(rng.integers(fps, 3 * fps))
+
+    video_info = sv.VideoInfo(width=width, height=height, fps=fps)
+    with sv.VideoSink(path, video_info) as sink:
+        for frame_index in range(total_frames):
+            frame = background.copy()
+            for departure, duration, start, end, color in vehicles:
+                t = (frame_index - departure) / duration
+                if 0 <= t <= 1.1:
+                    center = start + (end - start) * t
+                    x1, y1 = (center - size / 2).astype(int)
+                    x2, y2 = (center + size / 2).astype(int)
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness=-1)
+            sink.write_frame(frame)
+
+
+class StubDetector:
+    """
+    Deterministic stand-in for a detection model that finds the coloured
+    rectangles of the synthetic videos, so benchmarks run offline on a CPU.
+    Being pixel-based, it works on whole frames, ROI crops and slices alike.
+
+    Parameters:
+    -----------
+    latency : float
+        Seconds slept per image, to emulate the cost of a real model.
+    saturation_threshold : int
+        Minimum spread between colour channels of a vehicle pixel.
+    min_area : int
+        Smallest blob, in pixels, reported as a detection.
+    """
+
+    def __init__(
+        self, latency: float = 0.0, saturation_threshold: int = 60, min_area: int = 64
+    ) -> None:
+        self.latency = latency
+        self.saturation_threshold = saturation_threshold
+        self.min_area = min_area
+
+    def detect(self, image: np.ndarray) -> sv.Detections:
+        blue, green, red = cv2.split(image)
+        spread = cv2.subtract(
+            cv2.max(cv2.max(blue, green), red), cv2.min(cv2.min(blue, green), red)
+        )
+        _, mask = cv2.threshold(spread, self.saturation_threshold, 1, cv2.THRESH_BINARY)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        stats = stats[1:][stats[1:, cv2.CC_STAT_AREA] >= self.min_area]
+        x, y = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+        w, h = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+        return sv.Detections(
+            xyxy=np.stack([x, y, x + w, y + h], axis=1).astype(float).reshape(-1, 4),
+            confidence=np.full(len(stats), 0.9),
+            class_id=np.zeros(len(stats), dtype=int),
+        )
+
+    def __call__(self, images: List[np.ndarray]) -> List[sv.Detections]:
+        if self.latency:
+            time.sleep(self.latency * len(images))
+        return [self.detect(image) for image in images]
+
+
+def build_processor(
+    script: str, source_video_path: str, detector: StubDetector, **kwargs: Any
+) -> VideoProcessor:
+    """
+    Build the `VideoProcessor` of one of the `vehicleDetection*.py` presets
+    with `detector` in place of its model.
+    """
+    preset = PRESETS[script]
+    kwargs.setdefault("slice_wh", preset.get("slice_wh"))
+    kwargs.setdefault("dashboard", preset.get("dashboard", False))
+    return VideoProcessor(lambda: detector, source_video_path, **kwargs)
+
+
+def run_benchmark(processor: VideoProcessor) -> Dict[str, Any]:
+    """
+    Run `processor` over its source video with `process_video`, as the
+    scripts do, with every stage timed, and return the throughput and the
+    per-stage latencies.
+    """
+    # Quantiles over every call of the run, not a recent window
+    metrics = Metrics(enabled=True, window=1 << 16)
+    processor.metrics = metrics
+    instrument(processor, metrics)
+    start = time.perf_counter()
+    processor.process_video()
+    elapsed = time.perf_counter() - start
+
+    frame_count = int(metrics.counters.get("completed", 0))
+    stages = metrics.stage_summary()
+    measured = sum(stage["total_s"] for stage in stages.values())
+    return {
+        "frames": frame_count,
+        "seconds": elapsed,
+        "fps": frame_count / elapsed if elapsed > 0 else 0.0,
+        "other_s": max(0.0, elapsed - measured),
+        "stages": stages,
+        "counts": processor.detections_manager.snapshot(),
+    }
+
+
+def synthetic_video_for(
+    script: str,
+    video_dir: str,
+    total_frames: int,
+    resolution_wh: Tuple[int, int],
+    seed: int = 0,
+) -> str:
+    """
+    Path of the synthetic video matching the zones of the pipelines, generated
+    in `video_dir` on first use and named after `script`.
+    """
+    name = f"{script}_{resolution_wh[0]}x{resolution_wh[1]}_{total_frames}_{seed}.mp4"
+    path = os.path.join(video_dir, name)
+    if not os.path.exists(path):
+        make_synthetic_video(
+            path,
+            denormalize_polygons(ZONE_IN_POLYGONS, resolution_wh),
+            denormalize_polygons(ZONE_OUT_POLYGONS, resolution_wh),
+            resolution_wh,
+            total_frames=total_frames,
+            seed=seed,
+        )
+    return path
+
+
+def format_report(script: str, result: Dict[str, Any]) -> str:
+    lines = [
+        f"{script}: {result['frames']} frames in {result['seconds']:.2f}s "
+        f"({result['fps']:.1f} fps)",
+        f"  {'stage':<14}{'calls':>7}{'total s':>10}{'mean ms':>10}"
+        f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}",
+    ]
+    for stage, stats in result["stages"].items():
+        lines.append(
+            f"  {stage:<14}{stats['calls']:>7}{stats['total_s']:>10.3f}"
+            f"{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+            f"{stats['p90_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+        )
+    lines.append(f"  {'other':<14}{'':>7}{result['other_s']:>10.3f}")
+    return "\n".join(lines)
@@ -0,0 +1,58 @@
+import os
+import pickle
+from typing import Any, Dict, Iterable, Optional
+
+
+def get_state(obj: Any, exclude: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Instance attributes of `obj` that make up its state. Methods rebound on
+    the instance, such as the timing wrappers of `utils.metrics.instrument`,
+    are left out, and so are the attributes in `exclude`.
+    """
+    exclude = set(exclude)
+    return {
+        name: value
+        for name, value in vars(obj).items()
+        if name not in exclude and not callable(value)
+    }
+
+
+def set_state(obj: Any, state: Dict[str, Any]) -> None:
+    """
+    Restore on `obj` the attributes saved by `get_state`.
+    """
+    vars(obj).update(state)
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]) -> None:
+    """
+    Pickle `checkpoint` to `path`. It is written next to it first and then
+    moved in place, so a run killed while saving keeps its previous
+    checkpoint. Objects shared by several states, e.g. the Kalman filter of
+    ByteTrack and its tracks, are pickled together and stay shared.
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as checkpoint_file:
+        pickle.dump(checkpoint, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Checkpoint saved at `path`, or None when there is none.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as checkpoint_file:
+        return pickle.load(checkpoint_file)
+
+
+def segment_path(target_path: str, index: int) -> str:
+    """
+    File of the `index`-th segment of a video written in segments, next to
+    `target_path`, e.g. `out.part00003.mp4` for `out.mp4`.
+    """
+    root, extension = os.path.splitext(target_path)
+    return f"{root}.part{index:05d}{extension}"
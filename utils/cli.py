@@ -0,0 +1,419 @@
+import argparse
+from functools import partial
+import os
+from typing import Any, List, Optional
+
+# Only the standard library is imported here: supervision, OpenCV and the
+# detector backends are imported once the arguments are parsed and validated,
+# and only those the chosen options need, so `--help` and argument errors
+# return immediately
+
+DETECTORS = ["yolo", "roboflow"]
+# Options of a single video that do not apply to streams from --config_path,
+# whose outputs are set per stream in the config
+SINGLE_VIDEO_OPTIONS = [
+    "target_video_path",
+    "counts_path",
+    "slice_wh",
+    "dashboard",
+    "roi_margin",
+    "motion_gate",
+    "workers",
+    "batch_size",
+    "full_resolution_output",
+    "metrics_port",
+    "metrics_interval",
+]
+# Counts, sizes and strides, which must be at least 1
+POSITIVE_OPTIONS = [
+    "batch_size",
+    "queue_size",
+    "detect_stride",
+    "stride",
+    "workers",
+    "max_in_flight",
+]
+BACKENDS = ["pytorch", "onnx", "openvino"]  # as in utils.export
+
+# Option defaults of the original single-purpose scripts, which now run this
+# entry point with them
+PRESETS = {
+    "vehicleDetectionyolo": dict(detector="yolo"),
+    "vehicleDetectionyolo_withslicer": dict(detector="yolo", slice_wh=[640, 640]),
+    "vehicleDetectionrb": dict(detector="roboflow"),
+    "vehicleDetectionrb_withslicer": dict(
+        detector="roboflow", model_id="cars-jnnoy/1", slice_wh=[320, 320]
+    ),
+    "vehicleDetectionrb_aux": dict(detector="roboflow", dashboard=True),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Traffic Flow Analysis with YOLO or Roboflow models and ByteTrack"
+    )
+
+    parser.add_argument(
+        "--detector",
+        default="yolo",
+        choices=DETECTORS,
+        help="Model used to detect the vehicles",
+    )
+    parser.add_argument(
+        "--slice_wh",
+        default=None,
+        nargs=2,
+        metavar=("WIDTH", "HEIGHT"),
+        help="Detect on slices of this size instead of on whole frames, for "
+        "small vehicles in high resolution footage",
+        type=int,
+    )
+    parser.add_argument(
+        "--dashboard",
+        action="store_true",
+        help="Draw the counts of every out zone in a box in the frame corners",
+    )
+
+    yolo = parser.add_argument_group("YOLO detector")
+    yolo.add_argument(
+        "--source_weights_path",
+        default=None,
+        help="Path to the source weights file",
+        type=str,
+    )
+    yolo.add_argument(
+        "--backend",
+        default="pytorch",
+        choices=BACKENDS,
+        help="Run the weights with PyTorch, or export them (once, then cached) to "
+        "ONNX Runtime or OpenVINO for faster CPU inference",
+    )
+    yolo.add_argument("--imgsz", default=640, help="Input size of the model", type=int)
+    yolo.add_argument(
+        "--int8",
+        action="store_true",
+        help="Quantize the exported model to INT8, calibrated on frames of the "
+        "source video",
+    )
+    yolo.add_argument(
+        "--export_dir",
+        default=None,
+        help="Cache of exported models (default: exports/ next to the weights)",
+        type=str,
+    )
+
+    roboflow = parser.add_argument_group("Roboflow detector")
+    roboflow.add_argument(
+        "--model_id",
+        default="skyview-vehicle/4",
+        help="Roboflow model ID",
+        type=str,
+    )
+    roboflow.add_argument(
+        "--roboflow_api_key",
+        default=None,
+        help="Roboflow API KEY",
+        type=str,
+    )
+    roboflow.add_argument(
+        "--inference_server",
+        default=None,
+        help="Send frames to this Roboflow inference server, e.g. "
+        "http://localhost:9001, instead of running the model in process",
+        type=str,
+    )
+    roboflow.add_argument(
+        "--max_in_flight",
+        default=8,
+        help="Requests to the inference server outstanding at once",
+        type=int,
+    )
+
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--source_video_path",
+        help="Path to the source video file",
+        type=str,
+    )
+    source.add_argument(
+        "--config_path",
+        help="Path to the JSON file describing several streams and their zones, "
+        "served together by one detector",
+        type=str,
+    )
+    parser.add_argument(
+        "--target_video_path",
+        default=None,
+        help="Path to the target video file (output)",
+        type=str,
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Only count vehicles: no annotation, display or video output",
+    )
+    parser.add_argument(
+        "--counts_path",
+        default="counts.jsonl",
+        help="Path of the JSON lines file with counts and events (headless mode)",
+        type=str,
+    )
+    parser.add_argument(
+        "--confidence_threshold",
+        default=0.3,
+        help="Confidence threshold for the model",
+        type=float,
+    )
+    parser.add_argument(
+        "--iou_threshold", default=0.7, help="IOU threshold for the model", type=float
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Run decode, inference, tracking, annotation and encoding as "
+        "concurrent stages",
+    )
+    parser.add_argument(
+        "--queue_size",
+        default=4,
+        help="Capacity of the queues between pipeline stages",
+        type=int,
+    )
+    parser.add_argument(
+        "--batch_size",
+        default=1,
+        help="Number of frames sent to the detector in a single call",
+        type=int,
+    )
+    parser.add_argument(
+        "--roi_margin",
+        default=None,
+        help="Only detect within the zones plus this many pixels: frames are "
+        "cropped, or slices farther away skipped (disabled by default)",
+        type=int,
+    )
+    parser.add_argument(
+        "--detect_stride",
+        default=1,
+        help="Run the detector on every N-th frame and predict tracks in between",
+        type=int,
+    )
+    parser.add_argument(
+        "--adaptive_stride",
+        action="store_true",
+        help="Lower the detection stride while the scene is moving",
+    )
+    parser.add_argument(
+        "--lost_track_buffer",
+        default=30,
+        help="Frames (at 30 fps) a lost track is kept before its state is dropped",
+        type=int,
+    )
+    parser.add_argument(
+        "--start",
+        default=0.0,
+        help="Second of the video to start processing at",
+        type=float,
+    )
+    parser.add_argument(
+        "--end",
+        default=None,
+        help="Second of the video to stop processing at (default: the end)",
+        type=float,
+    )
+    parser.add_argument(
+        "--stride",
+        default=1,
+        help="Process every N-th frame only; the others are skipped undecoded",
+        type=int,
+    )
+    parser.add_argument(
+        "--motion_gate",
+        action="store_true",
+        help="Only run the detector on moving areas and around recent detections, "
+        "and skip frames with neither",
+    )
+    parser.add_argument(
+        "--checkpoint_path",
+        default=None,
+        help="Save the tracking and counting state to this file at regular "
+        "intervals (headless or video output only)",
+        type=str,
+    )
+    parser.add_argument(
+        "--checkpoint_interval",
+        default=300.0,
+        help="Seconds of video between checkpoints",
+        type=float,
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the checkpoint at --checkpoint_path, if there is one",
+    )
+    parser.add_argument(
+        "--detection_cache",
+        default=None,
+        help="Directory to keep detections in, read back instead of detecting "
+        "again when the same video is processed with the same detector settings",
+        type=str,
+    )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        help="Split the video into this many time segments processed in parallel "
+        "(headless only)",
+        type=int,
+    )
+    parser.add_argument(
+        "--shard_overlap",
+        default=2.0,
+        help="Seconds shared by consecutive segments to stitch tracks together",
+        type=float,
+    )
+    parser.add_argument(
+        "--process_scale",
+        default=1.0,
+        help="Resize frames by this factor right after decoding, e.g. 0.5 to "
+        "process 4K video at 1080p",
+        type=float,
+    )
+    parser.add_argument(
+        "--full_resolution_output",
+        action="store_true",
+        help="Draw the annotations on the frames at source resolution",
+    )
+    parser.add_argument(
+        "--writer",
+        default="ffmpeg",
+        choices=["ffmpeg", "cv2"],
+        help="Encode the output video with an ffmpeg process (falls back to OpenCV "
+        "when ffmpeg is not installed) or with OpenCV",
+    )
+    parser.add_argument(
+        "--codec", default="libx264", help="ffmpeg video encoder", type=str
+    )
+    parser.add_argument(
+        "--preset", default="veryfast", help="ffmpeg encoder preset", type=str
+    )
+    parser.add_argument(
+        "--crf",
+        default=23,
+        help="ffmpeg constant rate factor, lower is higher quality",
+        type=int,
+    )
+    parser.add_argument(
+        "--encode_wh",
+        default=None,
+        nargs=2,
+        metavar=("WIDTH", "HEIGHT"),
+        help="Resolution of the output video (default: the annotated frames')",
+        type=int,
+    )
+    parser.add_argument(
+        "--metrics_port",
+        default=None,
+        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics",
+        type=int,
+    )
+    parser.add_argument(
+        "--metrics_interval",
+        default=None,
+        help="Log a summary of the stage timings every this many seconds",
+        type=float,
+    )
+    return parser
+
+
+def parse_args(argv: Optional[List[str]] = None, **defaults: Any) -> argparse.Namespace:
+    """
+    Parse and validate the command line, without importing anything beyond
+    the standard library. `defaults` override the defaults of the options,
+    e.g. to preset the detector and the slicing.
+    """
+    parser = build_parser()
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+    # Presets count as set options: a preset's slicing or dashboard is not
+    # silently dropped in a mode that ignores it
+    unset = build_parser()
+
+    # A batch size of 0 would collect the whole video into one batch, and a
+    # stride of 0 never moves on
+    for name in POSITIVE_OPTIONS:
+        if getattr(args, name) < 1:
+            parser.error(f"--{name} must be at least 1")
+    if args.process_scale <= 0:
+        parser.error("--process_scale must be greater than 0")
+    if args.config_path is not None:
+        if not os.path.isfile(args.config_path):
+            parser.error(f"--config_path {args.config_path} does not exist")
+        for name in SINGLE_VIDEO_OPTIONS:
+            if getattr(args, name) != unset.get_default(name):
+                parser.error(f"--{name} cannot be used with --config_path")
+        if args.checkpoint_path is not None and not args.headless:
+            parser.error("--checkpoint_path with --config_path requires --headless")
+    elif not os.path.isfile(args.source_video_path):
+        parser.error(f"--source_video_path {args.source_video_path} does not exist")
+    if args.workers > 1:
+        if not args.headless:
+            parser.error("--workers requires --headless")
+        # Workers run the segments without the pipeline or metrics of a process
+        for name in ["pipeline", "metrics_port", "metrics_interval"]:
+            if getattr(args, name) != unset.get_default(name):
+                parser.error(f"--{name} cannot be used with --workers")
+    if args.resume and args.checkpoint_path is None:
+        parser.error("--resume requires --checkpoint_path")
+    if args.checkpoint_path is not None:
+        if args.workers > 1:
+            parser.error("--checkpoint_path cannot be used with --workers")
+        if not (args.headless or args.target_video_path or args.config_path):
+            parser.error("--checkpoint_path requires --headless or --target_video_path")
+    if args.detector == "yolo":
+        if args.source_weights_path is None:
+            parser.error("--detector yolo requires --source_weights_path")
+        if args.int8 and args.backend == "pytorch":
+            parser.error("--int8 requires --backend onnx or openvino")
+    else:
+        args.roboflow_api_key = os.environ.get(
+            "ROBOFLOW_API_KEY", args.roboflow_api_key
+        )
+        if args.roboflow_api_key is None:
+            parser.error(
+                "Roboflow API KEY is missing. Please provide it as an argument or set "
+                "the ROBOFLOW_API_KEY environment variable."
+            )
+    return args
+
+
+def detector_factory(
+    args: argparse.Namespace, calibration_video_path: Optional[str] = None
+) -> partial:
+    """
+    Picklable callable building the detector chosen by `args`; its backend is
+    only imported when it is called. INT8 exports are calibrated on
+    `calibration_video_path`, by default the source video.
+    """
+    from utils.detectors import RoboflowDetector, YoloDetector
+
+    if args.detector == "yolo":
+        return partial(
+            YoloDetector,
+            args.source_weights_path,
+            args.confidence_threshold,
+            args.iou_threshold,
+            backend=args.backend,
+            imgsz=args.imgsz,
+            int8=args.int8,
+            calibration_video_path=calibration_video_path or args.source_video_path,
+            export_dir=args.export_dir,
+        )
+    return partial(
+        RoboflowDetector,
+        args.model_id,
+        args.roboflow_api_key,
+        args.confidence_threshold,
+        args.iou_threshold,
+        inference_server=args.inference_server,
+        max_in_flight=args.max_in_flight,
+    )
@@ -0,0 +1,171 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import supervision as sv
+
+from utils.checkpoint import get_state
+from utils.managerDetecs import DetectionsManager
+from utils.overlay import StaticOverlay, polygons_key
+from utils.stride import KeyframeScheduler, TrackPropagator
+from utils.zones import ZoneIndex
+
+COLORS = sv.ColorPalette.from_hex(["#E6194B", "#3CB44B", "#FFE119", "#3C76D1"])
+
+
+class ZoneCounter:
+    """
+    Tracking, counting and annotation of the vehicles crossing the zones of
+    one video, shared by `VideoProcessor` and the streams of
+    `MultiStreamRunner`. Keyframe detections go through ByteTrack, tracks
+    are moved along on the frames in between, and a `DetectionsManager`
+    counts every track from the in zone it came from to the out zones it
+    reaches.
+
+    Parameters:
+    -----------
+    zones_in, zones_out : List[np.ndarray]
+        In and out zone polygons, in the coordinates of the detections.
+        They are also the polygons drawn, unless a subclass replaces
+        `self.zones_in` and `self.zones_out` to draw at another resolution.
+    resolution_wh : Tuple[int, int]
+        Size of the frames the detections are found on.
+    frame_rate : float
+        Rate at which frames are processed.
+    lost_track_buffer : int
+        Passed to ByteTrack; also bounds how long per-track state is kept.
+    detect_stride : int
+        Run the detector on every `detect_stride`-th frame only, and move
+        the tracks along in between, see `KeyframeScheduler`.
+    adaptive_stride : bool
+        Lower the detection stride while the scene is moving.
+    """
+
+    def __init__(
+        self,
+        zones_in: List[np.ndarray],
+        zones_out: List[np.ndarray],
+        resolution_wh: Tuple[int, int],
+        frame_rate: float,
+        lost_track_buffer: int = 30,
+        detect_stride: int = 1,
+        adaptive_stride: bool = False,
+    ) -> None:
+        self.zones_in = zones_in
+        self.zones_out = zones_out
+        self.zone_index = ZoneIndex(
+            zones_in + zones_out, resolution_wh, sv.Position.CENTER
+        )
+        # ByteTrack only sees keyframes, so its lost-track buffer is counted in
+        # keyframes rather than in video frames
+        self.tracker = sv.ByteTrack(
+            lost_track_buffer=lost_track_buffer,
+            frame_rate=frame_rate / detect_stride,
+        )
+        self.scheduler = KeyframeScheduler(detect_stride, adaptive_stride)
+        self.propagator = TrackPropagator()
+        # Per-track counting state is dropped only once ByteTrack has given up on
+        # the track too, so a track that comes back never loses its origin zone
+        self.detections_manager = DetectionsManager(
+            len(zones_in),
+            len(zones_out),
+            max_lost_frames=self.tracker.max_time_lost * detect_stride + 1,
+        )
+
+        self.overlay = StaticOverlay(self.draw_static)
+        self.box_annotator = sv.BoxAnnotator(color=COLORS)
+        self.label_annotator = sv.LabelAnnotator(
+            color=COLORS, text_color=sv.Color.BLACK
+        )
+        self.trace_annotator = sv.TraceAnnotator(
+            color=COLORS, position=sv.Position.CENTER, trace_length=100, thickness=2
+        )
+
+    def update_tracks(self, detections: Optional[sv.Detections]) -> sv.Detections:
+        """
+        Track the detections of a keyframe, or move the tracks along when
+        `detections` is None, and count them. Returns the tracks that came
+        from an in zone, with that zone as their class ID.
+        """
+        if detections is None:
+            detections = self.propagator.predict()
+        else:
+            detections = self.tracker.update_with_detections(detections)
+            # Without skipped frames there is nothing to propagate
+            if self.scheduler.max_stride > 1:
+                self.propagator.update(detections)
+
+        in_zones = self.zone_index.trigger(detections)
+        zones_in_count = len(self.zones_in)
+        return self.detections_manager.update_masks(
+            detections, in_zones[:, :zones_in_count], in_zones[:, zones_in_count:]
+        )
+
+    def track(
+        self, detections: Optional[sv.Detections]
+    ) -> Tuple[sv.Detections, Dict[int, Dict[int, int]]]:
+        detections = self.update_tracks(detections)
+        return detections, self.detections_manager.snapshot()
+
+    def count_events(
+        self, detections: Optional[sv.Detections]
+    ) -> List[Tuple[int, int, int]]:
+        self.update_tracks(detections)
+        return self.detections_manager.events
+
+    def checkpoint_state(self) -> Dict[str, Dict[str, Any]]:
+        """
+        State of everything that carries information from one frame to the
+        next: the tracker, the keyframe schedule and the counting.
+        """
+        return {
+            "tracker": get_state(self.tracker),
+            "scheduler": get_state(self.scheduler),
+            "propagator": get_state(self.propagator),
+            "detections_manager": get_state(self.detections_manager),
+        }
+
+    def draw_static(self, scene: np.ndarray) -> np.ndarray:
+        # There may be any number of zones, and not as many in as out
+        for i, zone_in in enumerate(self.zones_in):
+            scene = sv.draw_polygon(scene, zone_in, COLORS.by_idx(i))
+        for i, zone_out in enumerate(self.zones_out):
+            scene = sv.draw_polygon(scene, zone_out, COLORS.by_idx(i))
+        return scene
+
+    def annotate_frame(
+        self,
+        frame: np.ndarray,
+        detections: sv.Detections,
+        counts: Dict[int, Dict[int, int]] = None,
+    ) -> np.ndarray:
+        """
+        Draw the zones, the tracks and the counts of every out zone on
+        `frame`, in place.
+        """
+        if counts is None:
+            counts = self.detections_manager.snapshot()
+
+        # Zones (and any other static content) are drawn once and reused
+        annotated_frame = self.overlay.apply(
+            frame, polygons_key(self.zones_in + self.zones_out)
+        )
+
+        labels = [f"#{tracker_id}" for tracker_id in detections.tracker_id]
+        annotated_frame = self.trace_annotator.annotate(annotated_frame, detections)
+        annotated_frame = self.box_annotator.annotate(annotated_frame, detections)
+        annotated_frame = self.label_annotator.annotate(
+            annotated_frame, detections, labels
+        )
+
+        for zone_out_id, zone_out in enumerate(self.zones_out):
+            zone_center = sv.get_polygon_center(polygon=zone_out)
+            for i, (zone_in_id, count) in enumerate(
+                counts.get(zone_out_id, {}).items()
+            ):
+                annotated_frame = sv.draw_text(
+                    scene=annotated_frame,
+                    text=str(count),
+                    text_anchor=sv.Point(x=zone_center.x, y=zone_center.y + 40 * i),
+                    background_color=COLORS.by_idx(zone_in_id),
+                )
+        return annotated_frame
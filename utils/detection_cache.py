@@ -0,0 +1,146 @@
+import glob
+import hashlib
+import json
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import supervision as sv
+
+# Frame numbers and first row of each frame, then one row per detection
+COLUMNS = ["frames", "offsets", "xyxy", "confidence", "class_id"]
+
+
+def cache_key(settings: Dict[str, Any]) -> str:
+    """
+    Short hash of everything that determines the detections of a frame.
+    """
+    encoded = json.dumps(settings, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class DetectionCache:
+    """
+    Detections of video frames kept on disk, so that processing a video
+    again with the same detector and settings, e.g. to try other zones or
+    annotations, skips inference.
+
+    Detections are stored by column as NumPy arrays, loaded memory-mapped:
+    the boxes, confidences and class IDs of all frames one after the other,
+    the number of every frame, and the offset of the first row of each.
+    New detections are kept in memory until `flush` writes them as a new
+    part. The frame numbers of a part are written last, so a part is only
+    read once complete and an interrupted write never corrupts the cache.
+    Parts have random names, so processes can share a cache.
+
+    Parameters:
+    -----------
+    directory : str
+        Directory of the cache, one per `cache_key`.
+    settings : Optional[Dict[str, Any]]
+        Settings the cache was made with, saved in `settings.json` for
+        reference.
+    flush_frames : int
+        Frames held in memory before they are written.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        settings: Optional[Dict[str, Any]] = None,
+        flush_frames: int = 1000,
+    ) -> None:
+        self.directory = directory
+        self.flush_frames = flush_frames
+        os.makedirs(directory, exist_ok=True)
+        settings_path = os.path.join(directory, "settings.json")
+        if settings is not None and not os.path.exists(settings_path):
+            with open(settings_path, "w") as settings_file:
+                json.dump(settings, settings_file, indent=2, default=str)
+        self.hits = 0
+        self.misses = 0
+        self._parts: List[Dict[str, np.ndarray]] = []
+        self._index: Dict[int, Tuple[int, int]] = {}
+        self._pending: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for frames_path in sorted(glob.glob(os.path.join(directory, "*.frames.npy"))):
+            self._load_part(frames_path[: -len(".frames.npy")])
+
+    def _load_part(self, prefix: str) -> None:
+        part = {
+            column: np.load(f"{prefix}.{column}.npy", mmap_mode="r")
+            for column in COLUMNS
+        }
+        part_id = len(self._parts)
+        self._parts.append(part)
+        for row, frame_index in enumerate(part["frames"].tolist()):
+            self._index.setdefault(frame_index, (part_id, row))
+
+    def __contains__(self, frame_index: int) -> bool:
+        return frame_index in self._index or frame_index in self._pending
+
+    def get(self, frame_index: int) -> Optional[sv.Detections]:
+        """
+        Detections of the frame numbered `frame_index`, or None when they
+        are not cached.
+        """
+        if frame_index in self._pending:
+            columns = self._pending[frame_index]
+        elif frame_index in self._index:
+            part_id, row = self._index[frame_index]
+            part = self._parts[part_id]
+            start, end = part["offsets"][row], part["offsets"][row + 1]
+            columns = tuple(part[column][start:end] for column in COLUMNS[2:])
+        else:
+            self.misses += 1
+            return None
+        self.hits += 1
+        xyxy, confidence, class_id = columns
+        return sv.Detections(
+            xyxy=np.array(xyxy, dtype=float),
+            confidence=np.array(confidence, dtype=float),
+            class_id=np.array(class_id, dtype=int),
+        )
+
+    def put(self, frame_index: int, detections: sv.Detections) -> None:
+        """
+        Cache the detections of the frame numbered `frame_index`.
+        """
+        confidence = detections.confidence
+        if confidence is None:
+            confidence = np.ones(len(detections))
+        class_id = detections.class_id
+        if class_id is None:
+            class_id = np.zeros(len(detections))
+        self._pending[frame_index] = (
+            np.asarray(detections.xyxy, dtype=np.float64).reshape(-1, 4),
+            np.asarray(confidence, dtype=np.float64),
+            np.asarray(class_id, dtype=np.int32),
+        )
+        if len(self._pending) >= self.flush_frames:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the detections cached since the last flush as a new part.
+        """
+        if not self._pending:
+            return
+        frames = sorted(self._pending)
+        xyxy, confidence, class_id = zip(*(self._pending[index] for index in frames))
+        counts = [len(frame_confidence) for frame_confidence in confidence]
+        columns = {
+            "offsets": np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            "xyxy": np.concatenate(xyxy),
+            "confidence": np.concatenate(confidence),
+            "class_id": np.concatenate(class_id),
+            # Written last: the part is only read once this file exists
+            "frames": np.array(frames, dtype=np.int64),
+        }
+        prefix = os.path.join(self.directory, uuid.uuid4().hex[:12])
+        for column, values in columns.items():
+            with open(f"{prefix}.{column}.npy.tmp", "wb") as column_file:
+                np.save(column_file, values)
+            os.replace(f"{prefix}.{column}.npy.tmp", f"{prefix}.{column}.npy")
+        self._pending = {}
+        self._load_part(prefix)
@@ -0,0 +1,118 @@
+from typing import List, Optional
+
+import numpy as np
+import supervision as sv
+
+from utils.export import load_yolo, weights_digest
+from utils.inference_client import InferenceServerClient
+
+
+class YoloDetector:
+    """
+    Ultralytics YOLO model that detects a whole list of frames per call.
+    `ultralytics` is imported only when the detector is built; the backend
+    options are those of `utils.export.load_yolo`.
+    """
+
+    def __init__(
+        self,
+        source_weights_path: str,
+        confidence_threshold: float = 0.3,
+        iou_threshold: float = 0.7,
+        backend: str = "pytorch",
+        imgsz: int = 640,
+        int8: bool = False,
+        calibration_video_path: Optional[str] = None,
+        export_dir: Optional[str] = None,
+    ) -> None:
+        # Hashed once, for both the export cache and the detection cache
+        digest = weights_digest(source_weights_path)
+        self.model = load_yolo(
+            source_weights_path,
+            backend=backend,
+            imgsz=imgsz,
+            int8=int8,
+            calibration_video_path=calibration_video_path,
+            export_dir=export_dir,
+            digest=digest,
+        )
+        self.conf_threshold = confidence_threshold
+        self.iou_threshold = iou_threshold
+        self.imgsz = imgsz
+        # Everything the detections depend on, to key cached detections
+        self.cache_settings = dict(
+            detector="yolo",
+            weights=digest,
+            backend=backend,
+            imgsz=imgsz,
+            int8=int8,
+            confidence=confidence_threshold,
+            iou=iou_threshold,
+        )
+
+    def __call__(self, frames: List[np.ndarray]) -> List[sv.Detections]:
+        results = self.model(
+            frames,
+            verbose=False,
+            conf=self.conf_threshold,
+            iou=self.iou_threshold,
+            imgsz=self.imgsz,
+        )
+        detections_batch = []
+        for result in results:
+            detections = sv.Detections.from_ultralytics(result)
+            detections.class_id = np.zeros(len(detections), dtype=int)
+            detections_batch.append(detections)
+        return detections_batch
+
+
+class RoboflowDetector:
+    """
+    Roboflow model run through `inference`, detecting a whole list of frames
+    per call. `inference` is imported only when the detector is built. With
+    `inference_server`, frames are sent to that server instead, see
+    `InferenceServerClient`.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        roboflow_api_key: str,
+        confidence_threshold: float = 0.3,
+        iou_threshold: float = 0.7,
+        inference_server: Optional[str] = None,
+        max_in_flight: int = 8,
+    ) -> None:
+        if inference_server is not None:
+            self.model = InferenceServerClient(
+                inference_server,
+                model_id,
+                roboflow_api_key,
+                max_in_flight=max_in_flight,
+            )
+        else:
+            from inference.models.utils import get_roboflow_model
+
+            self.model = get_roboflow_model(model_id=model_id, api_key=roboflow_api_key)
+        self.conf_threshold = confidence_threshold
+        self.iou_threshold = iou_threshold
+        # Everything the detections depend on, to key cached detections; the
+        # server gets JPEG-compressed frames, so its detections differ
+        self.cache_settings = dict(
+            detector="roboflow",
+            model_id=model_id,
+            inference_server=inference_server is not None,
+            confidence=confidence_threshold,
+            iou=iou_threshold,
+        )
+
+    def __call__(self, frames: List[np.ndarray]) -> List[sv.Detections]:
+        results = self.model.infer(
+            frames, confidence=self.conf_threshold, iou_threshold=self.iou_threshold
+        )
+        detections_batch = []
+        for result in results:
+            detections = sv.Detections.from_inference(result)
+            detections.class_id = np.zeros(len(detections), dtype=int)
+            detections_batch.append(detections)
+        return detections_batch
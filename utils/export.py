@@ -0,0 +1,233 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+import supervision as sv
+
+from utils.frames import frame_range, read_frames, video_digest
+
+BACKENDS = ["pytorch", "onnx", "openvino"]
+
+
+def weights_digest(weights_path: str) -> str:
+    """
+    Short SHA-256 of a weights file, so an export is never reused for
+    different weights stored under the same name.
+    """
+    digest = hashlib.sha256()
+    with open(weights_path, "rb") as weights_file:
+        for chunk in iter(lambda: weights_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def export_path(
+    weights_path: str,
+    backend: str,
+    imgsz: int = 640,
+    int8: bool = False,
+    export_dir: Optional[str] = None,
+    calibration_video_path: Optional[str] = None,
+    digest: Optional[str] = None,
+) -> str:
+    """
+    Where the export of `weights_path` for `backend` is cached: in
+    `export_dir` (by default an `exports` directory next to the weights),
+    under a name made of the weights hash, the input size and the precision,
+    and for INT8 the digest of the calibration video. Pass the
+    `weights_digest` of the weights as `digest` if it is already known.
+    """
+    if export_dir is None:
+        export_dir = os.path.join(os.path.dirname(weights_path), "exports")
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    precision = "fp32"
+    if int8:
+        precision = f"int8-{video_digest(calibration_video_path)}"
+    digest = digest or weights_digest(weights_path)
+    name = f"{stem}-{digest}-{imgsz}-{precision}"
+    suffix = ".onnx" if backend == "onnx" else "_openvino_model"
+    return os.path.join(export_dir, name + suffix)
+
+
+def calibration_frames(source_video_path: str, count: int = 64) -> List[np.ndarray]:
+    """
+    `count` frames spread evenly over a video, to calibrate INT8
+    quantization on the footage the model will actually see.
+    """
+    video_info = sv.VideoInfo.from_video_path(source_video_path)
+    stride = max(1, video_info.total_frames // count)
+    frames = frame_range(video_info, stride=stride)
+    return list(read_frames(source_video_path, frames[:count]))
+
+
+def letterbox(image: np.ndarray, imgsz: int) -> np.ndarray:
+    """
+    Model input for `image` as ultralytics prepares it: resized to fit an
+    `imgsz` square, padded with grey, RGB, CHW, scaled to [0, 1].
+    """
+    height, width = image.shape[:2]
+    scale = imgsz / max(height, width)
+    resized_wh = (round(width * scale), round(height * scale))
+    resized = cv2.resize(image, resized_wh, interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - resized_wh[1]) // 2, (imgsz - resized_wh[0]) // 2
+    canvas[top : top + resized_wh[1], left : left + resized_wh[0]] = resized
+    tensor = canvas[..., ::-1].transpose(2, 0, 1)[None].astype(np.float32)
+    return tensor / 255
+
+
+def quantize_onnx(
+    source_path: str, target_path: str, frames: List[np.ndarray], imgsz: int
+) -> None:
+    """
+    Static INT8 quantization of an ONNX model with ONNX Runtime, with the
+    activation ranges calibrated on `frames`.
+    """
+    import onnxruntime
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    session = onnxruntime.InferenceSession(
+        source_path, providers=["CPUExecutionProvider"]
+    )
+    input_name = session.get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self) -> None:
+            self.inputs = ({input_name: letterbox(frame, imgsz)} for frame in frames)
+
+        def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+            return next(self.inputs, None)
+
+    quantize_static(
+        source_path,
+        target_path,
+        FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+
+
+def _calibration_dataset(
+    work_dir: str, frames: List[np.ndarray], names: Dict[int, str]
+) -> str:
+    """
+    Write `frames` as an unlabelled ultralytics dataset and return its YAML.
+    """
+    images_dir = os.path.join(work_dir, "calibration", "images")
+    os.makedirs(images_dir)
+    for index, frame in enumerate(frames):
+        cv2.imwrite(os.path.join(images_dir, f"{index:04d}.jpg"), frame)
+    yaml_path = os.path.join(work_dir, "calibration.yaml")
+    with open(yaml_path, "w") as yaml_file:
+        yaml_file.write(f"path: {os.path.dirname(images_dir)}\n")
+        yaml_file.write("train: images\nval: images\nnames:\n")
+        for class_id, name in names.items():
+            yaml_file.write(f"  {class_id}: {name}\n")
+    return yaml_path
+
+
+def export_yolo(
+    weights_path: str,
+    target_path: str,
+    backend: str,
+    imgsz: int = 640,
+    int8: bool = False,
+    calibration_video_path: Optional[str] = None,
+) -> None:
+    """
+    Export YOLO weights to ONNX or OpenVINO with dynamic batch size, INT8
+    quantized if asked, and move the result to `target_path`. The export is
+    built next to the target and only moved there once complete, so an
+    interrupted or concurrent export never leaves a broken cache entry.
+    """
+    from ultralytics import YOLO
+
+    if int8 and calibration_video_path is None:
+        raise ValueError("INT8 export needs a video to calibrate on")
+    export_dir = os.path.dirname(target_path)
+    os.makedirs(export_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=export_dir) as work_dir:
+        model = YOLO(shutil.copy(weights_path, work_dir))
+        frames = calibration_frames(calibration_video_path) if int8 else []
+        if backend == "openvino":
+            options: Dict[str, Any] = {}
+            if int8:
+                options = dict(
+                    int8=True, data=_calibration_dataset(work_dir, frames, model.names)
+                )
+            exported = model.export(
+                format="openvino", imgsz=imgsz, dynamic=True, **options
+            )
+        elif backend == "onnx":
+            exported = model.export(format="onnx", imgsz=imgsz, dynamic=True)
+            if int8:
+                quantized = os.path.join(work_dir, "int8.onnx")
+                quantize_onnx(exported, quantized, frames, imgsz)
+                exported = quantized
+        else:
+            raise ValueError(f"Unknown export backend {backend!r}")
+        try:
+            os.rename(exported, target_path)
+        except OSError:
+            # Another process exported the same model first, e.g. a sharding
+            # worker; an OpenVINO export is a directory, not replaced
+            if not os.path.exists(target_path):
+                raise
+
+
+def load_yolo(
+    weights_path: str,
+    backend: str = "pytorch",
+    imgsz: int = 640,
+    int8: bool = False,
+    calibration_video_path: Optional[str] = None,
+    export_dir: Optional[str] = None,
+    digest: Optional[str] = None,
+) -> Any:
+    """
+    Ultralytics YOLO model for `weights_path` running on `backend`. ONNX and
+    OpenVINO exports are made on first use and loaded from the cache on
+    later runs. `ultralytics` is imported only when this is called.
+
+    Parameters:
+    -----------
+    weights_path : str
+        PyTorch `.pt` weights.
+    backend : str
+        One of `BACKENDS`.
+    imgsz : int
+        Input size of the exported model.
+    int8 : bool
+        Quantize the export to INT8, calibrated on `calibration_video_path`.
+    calibration_video_path : Optional[str]
+        Video whose frames calibrate the INT8 quantization.
+    export_dir : Optional[str]
+        Cache directory of the exports, see `export_path`.
+    digest : Optional[str]
+        `weights_digest` of the weights, if already computed.
+    """
+    from ultralytics import YOLO
+
+    if backend == "pytorch":
+        return YOLO(weights_path)
+    if int8 and calibration_video_path is None:
+        raise ValueError("INT8 export needs a video to calibrate on")
+    target_path = export_path(
+        weights_path, backend, imgsz, int8, export_dir, calibration_video_path, digest
+    )
+    if not os.path.exists(target_path):
+        export_yolo(
+            weights_path, target_path, backend, imgsz, int8, calibration_video_path
+        )
+    return YOLO(target_path, task="detect")
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import sys
+from typing import Iterator, Optional
+
+import cv2
+import numpy as np
+import supervision as sv
+
+
+def frame_range(
+    video_info: sv.VideoInfo,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    stride: int = 1,
+) -> range:
+    """
+    Indices of the source frames to process: every `stride`-th frame of the
+    window from `start` to `end` seconds (the whole video by default).
+    """
+    if start < 0 or stride < 1:
+        raise ValueError("start must be non-negative and stride at least 1")
+    total_frames = video_info.total_frames
+    if not total_frames or total_frames < 0:
+        # Live streams do not report their length
+        total_frames = sys.maxsize
+    first = min(total_frames, int(round(start * video_info.fps)))
+    last = total_frames
+    if end is not None:
+        last = min(total_frames, max(first, int(round(end * video_info.fps))))
+    return range(first, last, stride)
+
+
+def read_frames(source_path: str, frames: range) -> Iterator[np.ndarray]:
+    """
+    Decode the frames of `frames`, a range from `frame_range`. The video is
+    sought to the first one by timestamp, or grabbed up to it when it has no
+    frame rate to seek by. The frames in between are only grabbed, never
+    converted to images, so a short window of a long video or a large
+    stride costs a fraction of a full decode.
+    """
+    video = cv2.VideoCapture(source_path)
+    if not video.isOpened():
+        raise RuntimeError(f"Could not open video at {source_path}")
+    try:
+        if frames.start > 0:
+            fps = video.get(cv2.CAP_PROP_FPS)
+            if fps > 0:
+                video.set(cv2.CAP_PROP_POS_MSEC, frames.start * 1000 / fps)
+            else:
+                # Streams and some containers report no frame rate to seek by
+                for _ in range(frames.start):
+                    if not video.grab():
+                        return
+        for position in range(len(frames)):
+            if position > 0:
+                for _ in range(frames.step - 1):
+                    if not video.grab():
+                        return
+            success, frame = video.read()
+            if not success:
+                return
+            yield frame
+    finally:
+        video.release()
+
+
+def video_digest(path: str, samples: int = 16, block_size: int = 1 << 16) -> str:
+    """
+    Short SHA-256 of the size of a video file and of `samples` blocks spread
+    evenly over it. Reading a few blocks rather than the whole file keeps it
+    instant on hours of footage, while any other recording, or the same one
+    cut or re-encoded, still gets another digest.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as video_file:
+        for sample in range(samples):
+            video_file.seek(max(0, size - block_size) * sample // max(1, samples - 1))
+            digest.update(video_file.read(block_size))
+    return digest.hexdigest()[:16]
@@ -0,0 +1,130 @@
+import asyncio
+import atexit
+import base64
+import threading
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+
+class InferenceServerClient:
+    """
+    Client of a Roboflow inference server (`inference server start`) with
+    the same `infer` method as the models of `get_roboflow_model`, so it
+    can stand in for them.
+
+    Every image of an `infer` call is sent as its own HTTP request over a
+    pool of keep-alive connections, with up to `max_in_flight` requests
+    outstanding at once, so the server stays busy instead of waiting a full
+    round trip per image. Responses are returned in the order of the
+    images. `aiohttp` is imported only when the client is built; requests
+    run on an asyncio loop of their own thread.
+
+    Parameters:
+    -----------
+    api_url : str
+        Base URL of the server, e.g. `http://localhost:9001`.
+    model_id : str
+        Roboflow model ID served by it.
+    api_key : Optional[str]
+        Roboflow API key the server uses to fetch the model.
+    max_in_flight : int
+        Requests outstanding at once, and size of the connection pool.
+    jpeg_quality : int
+        Quality of the JPEG images are sent as.
+    timeout : float
+        Seconds a request may take before it fails.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        model_id: str,
+        api_key: Optional[str] = None,
+        max_in_flight: int = 8,
+        jpeg_quality: int = 90,
+        timeout: float = 60.0,
+    ) -> None:
+        import aiohttp
+
+        self.url = api_url.rstrip("/") + "/infer/object_detection"
+        self.model_id = model_id
+        self.api_key = api_key
+        self.max_in_flight = max_in_flight
+        self.jpeg_quality = jpeg_quality
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+        async def open_session() -> Any:
+            return aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=max_in_flight),
+                timeout=aiohttp.ClientTimeout(total=timeout),
+                raise_for_status=True,
+            )
+
+        self.session = self._run(open_session())
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        atexit.register(self.close)
+
+    def _run(self, coroutine: Any) -> Any:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def encode(self, image: np.ndarray) -> str:
+        _, buffer = cv2.imencode(
+            ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        )
+        return base64.b64encode(buffer).decode("ascii")
+
+    async def _request(
+        self, image: np.ndarray, confidence: float, iou_threshold: float
+    ) -> Dict[str, Any]:
+        async with self.semaphore:
+            # cv2 releases the GIL, so images are encoded in parallel
+            value = await self.loop.run_in_executor(None, self.encode, image)
+            payload = {
+                "model_id": self.model_id,
+                "api_key": self.api_key,
+                "image": {"type": "base64", "value": value},
+                "confidence": confidence,
+                "iou_threshold": iou_threshold,
+            }
+            async with self.session.post(self.url, json=payload) as response:
+                return await response.json()
+
+    async def _infer(
+        self, images: List[np.ndarray], confidence: float, iou_threshold: float
+    ) -> List[Dict[str, Any]]:
+        tasks = [
+            asyncio.ensure_future(self._request(image, confidence, iou_threshold))
+            for image in images
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # One failed request fails the call; the others are not awaited
+            for task in tasks:
+                task.cancel()
+            raise
+
+    def infer(
+        self,
+        images: List[np.ndarray],
+        confidence: float = 0.3,
+        iou_threshold: float = 0.7,
+    ) -> List[Dict[str, Any]]:
+        """
+        Detect objects in every image, returning one server response per
+        image, readable by `sv.Detections.from_inference`.
+        """
+        return self._run(self._infer(images, confidence, iou_threshold))
+
+    def close(self) -> None:
+        if self.loop.is_closed():
+            return
+        self._run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
@@ -1,11 +1,18 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 import numpy as np
 import supervision as sv
+from utils.tracks import TrackerIndex
 
 class DetMan:
-    def __init__(self) -> None:
-        self.tracker_id_to_zone_status: Dict[int, bool] = {}  # Tracker ID to whether the object is inside the zone
+    def __init__(self, frame_rate: float = 30, max_lost_frames: Optional[int] = None) -> None:
+        # Per-track occupancy state, one row per tracker ID, dropped once the track is lost for max_lost_frames
+        self.tracks = TrackerIndex(max_lost_frames)
+        self.tracks.add_column("inside", False, bool)  # Whether the object is inside the zone
+        self.tracks.add_column("dwell_frames", 0, int)  # Frames the object has spent inside the zone
+        self.frame_rate = frame_rate
         self.count_inside: int = 0  # Count of objects currently inside the zone
+        self.entered = np.empty(0, dtype=int)  # Tracker IDs that entered the zone on the last update
+        self.exited = np.empty(0, dtype=int)  # Tracker IDs that left the zone on the last update
         self.previous_positions: Dict[int, Tuple[float, float]] = {}  # Tracker ID to (x, y)
         self.speeds: Dict[int, float] = {}  # Tracker ID to speed
 
@@ -15,7 +22,10 @@ class DetMan:
             y_center = (bbox[1] + bbox[3]) / 2
             self.previous_positions[tracker_id] = (x_center, y_center)
 
-    def calculate_speed(self, tracker_id, new_position, frame_rate, scale):
+    def calculate_speed(self, tracker_id, new_position, frame_rate=None, scale=1.0):
+        # Defaults to the rate frames are processed at, i.e. after any frame stride
+        if frame_rate is None:
+            frame_rate = self.frame_rate
         if tracker_id not in self.previous_positions:
             return 0
         old_position = self.previous_positions[tracker_id]
@@ -32,29 +42,119 @@ class DetMan:
         
         # detections_all is just Detections object
         # detections_in_zones is a List<Detections>, just 1 element
+        in_zone = np.isin(detections_all.tracker_id, detections_in_zone[0].tracker_id)
+        return self.update_mask(detections_all, in_zone)
 
-        # Track objects entering the zone
-        for tracker_id in detections_in_zone[0].tracker_id:
-            self.tracker_id_to_zone_status[tracker_id] = True
-            self.count_inside += 1
+    def update_mask(self, detections_all: sv.Detections, in_zone: np.ndarray) -> sv.Detections:
+        """
+        Same as `update`, with zone membership given as a boolean array with one
+        value per detection.
 
-        nonInzone = [item for item in detections_all.tracker_id if item not in detections_in_zone[0].tracker_id]
-        for i in nonInzone:
-            self.tracker_id_to_zone_status[i] = False
+        Tracks that are not detected on this frame keep their last state, so a
+        vehicle briefly lost inside the zone does not leave and re-enter it.
+        """
+        tracker_ids = np.asarray(detections_all.tracker_id, dtype=int)
+        rows = self.tracks.observe(tracker_ids)
+        for tracker_id in self.tracks.evicted.tolist():
+            self.previous_positions.pop(tracker_id, None)
+            self.speeds.pop(tracker_id, None)
+        inside = self.tracks["inside"]
+        was_inside = inside[rows]
 
-        # Track objects leaving the zone
-        for tracker_id in detections_all.tracker_id:
-            if tracker_id in self.tracker_id_to_zone_status and not self.tracker_id_to_zone_status[tracker_id]:
-                self.count_inside -= 1
-        
-        # Mark objects that are outside the zone
-        for tracker_id in detections_all.tracker_id:
-            if tracker_id in self.tracker_id_to_zone_status:
-                self.tracker_id_to_zone_status[tracker_id] = False
+        self.entered = tracker_ids[in_zone & ~was_inside]
+        self.exited = tracker_ids[~in_zone & was_inside]
+        inside[rows] = in_zone
+        self.tracks["dwell_frames"][rows[in_zone]] += 1
+        self.count_inside = int(np.count_nonzero(in_zone))
+
+        # Keep only the detections inside the zone
+        detections_all.class_id = np.where(in_zone, 0, -1)
+        return detections_all[in_zone]
+
+    def dwell_time(self, tracker_ids: np.ndarray) -> np.ndarray:
+        """
+        Seconds each tracker ID has spent inside the zone so far.
+        """
+        rows = self.tracks.find(tracker_ids)
+        dwell_frames = np.where(rows >= 0, self.tracks["dwell_frames"][rows], 0)
+        return dwell_frames / self.frame_rate
+
+
+class DetectionsManager:
+    def __init__(
+        self, zones_in_count: int, zones_out_count: int, max_lost_frames: Optional[int] = None
+    ) -> None:
+        # Per-track state, one row per tracker ID, dropped once the track is lost for max_lost_frames
+        self.tracks = TrackerIndex(max_lost_frames)
+        self.tracks.add_column("zone_in_id", -1, int)  # Zone where the track came from
+        self.tracks.add_column("counted", False, bool, zones_out_count)  # Out zones already counted
+        self.counts = np.zeros((zones_out_count, zones_in_count), dtype=int)  # counts[zone_out_id, zone_in_id]
+        self.first_counted = np.full(self.counts.shape, -1, dtype=int)  # Order each count first became nonzero, -1 before
+        self.events: List[Tuple[int, int, int]] = []  # (tracker_id, zone_in_id, zone_out_id) counted on the last update
+
+    def update(
+        self,
+        detections_all: sv.Detections,
+        detections_in_zones: List[sv.Detections],
+        detections_out_zones: List[sv.Detections],
+    ) -> sv.Detections:
+        in_zones = np.stack(
+            [np.isin(detections_all.tracker_id, d.tracker_id) for d in detections_in_zones], axis=1
+        )
+        out_zones = np.stack(
+            [np.isin(detections_all.tracker_id, d.tracker_id) for d in detections_out_zones], axis=1
+        )
+        return self.update_masks(detections_all, in_zones, out_zones)
+
+    def update_masks(
+        self,
+        detections_all: sv.Detections,
+        in_zones: np.ndarray,
+        out_zones: np.ndarray,
+    ) -> sv.Detections:
+        """
+        Same as `update`, with zone membership given as boolean arrays of shape
+        (detections, zones) instead of one filtered Detections per zone.
+        """
+        tracker_ids = np.asarray(detections_all.tracker_id, dtype=int)
+        rows = self.tracks.observe(tracker_ids)
+        zone_in_id = self.tracks["zone_in_id"]
+        counted = self.tracks["counted"]
+
+        # A track keeps the first in zone it was seen in (lowest zone id on ties)
+        entering = in_zones.any(axis=1) & (zone_in_id[rows] == -1)
+        zone_in_id[rows[entering]] = np.argmax(in_zones[entering], axis=1)
+        origins = zone_in_id[rows]
+
+        # Count every (track, out zone) pair once, as soon as the track has an origin
+        hits = out_zones & (origins >= 0)[:, None] & ~counted[rows]
+        zone_out_ids, hit_idx = np.nonzero(hits.T)
+        counted[rows[hit_idx], zone_out_ids] = True
+        self.count(origins[hit_idx], zone_out_ids)
+        self.events = list(
+            zip(tracker_ids[hit_idx].tolist(), origins[hit_idx].tolist(), zone_out_ids.tolist())
+        )
+
+        detections_all.class_id = origins
+        return detections_all[origins != -1]
 
-        # Update detections' class IDs based on zone status
-        detections_all.class_id = np.vectorize(
-            lambda x: 0 if self.tracker_id_to_zone_status.get(x, False) else -1
-        )(detections_all.tracker_id)
+    def count(self, zone_in_ids: np.ndarray, zone_out_ids: np.ndarray) -> None:
+        """
+        Count one vehicle from zone_in_ids[i] to zone_out_ids[i] for every i.
+        """
+        np.add.at(self.counts, (zone_out_ids, zone_in_ids), 1)
+        for pair in zip(zone_out_ids.tolist(), zone_in_ids.tolist()):
+            if self.first_counted[pair] == -1:
+                self.first_counted[pair] = self.first_counted.max() + 1
 
-        return detections_all[detections_all.class_id != -1]
+    def snapshot(self) -> Dict[int, Dict[int, int]]:
+        """
+        Nonzero counts as {zone_out_id: {zone_in_id: count}}, both levels in the
+        order the counts first became nonzero, so labels keep their place on screen.
+        """
+        pairs = np.argwhere(self.first_counted >= 0)
+        pairs = pairs[np.argsort(self.first_counted[tuple(pairs.T)])]
+        snapshot: Dict[int, Dict[int, int]] = {}
+        for zone_out_id, zone_in_id in pairs.tolist():
+            snapshot.setdefault(zone_out_id, {})[zone_in_id] = int(self.counts[zone_out_id, zone_in_id])
+        return snapshot
@@ -0,0 +1,305 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class RollingHistogram:
+    """
+    Latency samples of one stage. Quantiles are computed over the last
+    `window` samples, while `count` and `total` cover the whole run.
+    """
+
+    def __init__(self, window: int = 1024) -> None:
+        self.values = np.zeros(window)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, value: float) -> None:
+        with self._lock:
+            self.values[self.count % len(self.values)] = value
+            self.count += 1
+            self.total += value
+
+    def quantiles(self, quantiles: Tuple[float, ...] = QUANTILES) -> List[float]:
+        with self._lock:
+            values = self.values[: min(self.count, len(self.values))].copy()
+        if len(values) == 0:
+            return [0.0] * len(quantiles)
+        return [float(value) for value in np.quantile(values, quantiles)]
+
+
+class Metrics:
+    """
+    Stage timings, counters and gauges of a running pipeline, exposed as a
+    periodic log line and as a Prometheus text endpoint on localhost.
+
+    Nested stages are timed exclusively, per thread. When disabled, `wrap`
+    and `iterate` hand back what they were given and nothing is recorded,
+    so an instrumented pipeline runs exactly as an uninstrumented one.
+
+    Parameters:
+    -----------
+    enabled : bool
+        Record anything at all.
+    port : Optional[int]
+        Serve `/metrics` on this port of 127.0.0.1 while running.
+    log_interval : Optional[float]
+        Seconds between summary lines written under the progress bar.
+    window : int
+        Number of recent samples the latency quantiles are computed from.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        port: Optional[int] = None,
+        log_interval: Optional[float] = None,
+        window: int = 1024,
+    ) -> None:
+        self.enabled = enabled
+        self.port = port
+        self.log_interval = log_interval
+        self.window = window
+        self.stages: Dict[str, RollingHistogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: List[Tuple[str, Dict[str, str], Callable[[], float]]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _histogram(self, stage: str) -> RollingHistogram:
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(
+                    stage, RollingHistogram(self.window)
+                )
+        return histogram
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        children = self._local.__dict__.setdefault("children", [])
+        children.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._histogram(stage).record(elapsed - children.pop())
+            if children:
+                children[-1] += elapsed
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        if not self.enabled:
+            return function
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            with self.measure(stage):
+                return function(*args, **kwargs)
+
+        return timed
+
+    def iterate(
+        self, stage: str, iterable: Iterable, counter: Optional[str] = None
+    ) -> Iterable:
+        """
+        Time every step of `iterable` as `stage`, e.g. decoding the next
+        frame, and count the items produced in `counter`.
+        """
+        if not self.enabled:
+            return iterable
+
+        def timed() -> Iterator:
+            iterator = iter(iterable)
+            while True:
+                with self.measure(stage):
+                    item = next(iterator, None)
+                if item is None:
+                    return
+                if counter is not None:
+                    self.increment(counter)
+                yield item
+
+        return timed()
+
+    def increment(self, counter: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def add_gauge(self, name: str, function: Callable[[], float], **labels: str):
+        """
+        Register a value read when metrics are rendered, e.g. a queue depth.
+        """
+        if self.enabled:
+            self.gauges.append((name, labels, function))
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = ["# TYPE vehicle_stage_seconds summary"]
+        for stage, histogram in list(self.stages.items()):
+            for quantile, value in zip(QUANTILES, histogram.quantiles()):
+                lines.append(
+                    f'vehicle_stage_seconds{{stage="{stage}",quantile="{quantile}"}} '
+                    f"{value:.6f}"
+                )
+            lines.append(
+                f'vehicle_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}'
+            )
+            lines.append(
+                f'vehicle_stage_seconds_count{{stage="{stage}"}} {histogram.count}'
+            )
+        lines.append("# TYPE vehicle_frames_total counter")
+        for counter, value in list(self.counters.items()):
+            lines.append(f'vehicle_frames_total{{state="{counter}"}} {value:g}')
+        for name, labels, function in self.gauges:
+            if f"# TYPE vehicle_{name} gauge" not in lines:
+                lines.append(f"# TYPE vehicle_{name} gauge")
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+            lines.append(f"vehicle_{name}{{{label_text}}} {function():g}")
+        return "\n".join(lines) + "\n"
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Number of calls, total seconds, and mean, p50, p90 and p99 latency
+        in milliseconds of every stage, e.g. for a benchmark report.
+        """
+        summary = {}
+        for stage, histogram in list(self.stages.items()):
+            p50, p90, p99 = (value * 1000 for value in histogram.quantiles())
+            summary[stage] = {
+                "calls": histogram.count,
+                "total_s": histogram.total,
+                "mean_ms": histogram.total * 1000 / max(1, histogram.count),
+                "p50_ms": p50,
+                "p90_ms": p90,
+                "p99_ms": p99,
+            }
+        return summary
+
+    def summary(self) -> str:
+        """
+        One line with the median and p99 of every stage, the counters and
+        the gauges.
+        """
+        parts = []
+        for stage, histogram in list(self.stages.items()):
+            p50, _, p99 = histogram.quantiles()
+            parts.append(f"{stage} {p50 * 1000:.1f}/{p99 * 1000:.1f}ms")
+        parts.extend(
+            f"{counter}={value:g}" for counter, value in self.counters.items()
+        )
+        parts.extend(
+            f"{name}[{','.join(labels.values())}]={function():g}"
+            for name, labels, function in self.gauges
+        )
+        return "metrics (p50/p99): " + " | ".join(parts)
+
+    def _report(self) -> None:
+        while not self._stop.wait(self.log_interval):
+            tqdm.write(self.summary())
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        self._stop.clear()
+        if self.port is not None:
+            self._server = ThreadingHTTPServer(
+                ("127.0.0.1", self.port), _metrics_handler(self)
+            )
+            self._threads.append(
+                threading.Thread(target=self._server.serve_forever, daemon=True)
+            )
+        if self.log_interval:
+            self._threads.append(threading.Thread(target=self._report, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        if not self.enabled:
+            return
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        dropped = self.counters.get("decoded", 0) - self.counters.get("completed", 0)
+        if dropped > 0:
+            self.increment("dropped", dropped)
+        if self.log_interval:
+            tqdm.write(self.summary())
+
+    def __enter__(self) -> "Metrics":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+
+def _metrics_handler(metrics: Metrics) -> type:
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return MetricsHandler
+
+
+def instrument(processor: Any, timer: Metrics) -> None:
+    """
+    Route the stages of a `VideoProcessor` through `timer`.
+    """
+    processor.infer = timer.wrap("inference", processor.infer)
+    if getattr(processor, "slicer", None) is not None:
+        processor.slicer.callback = processor.infer
+        processor.slicer.detect_batch = timer.wrap(
+            "slicing", processor.slicer.detect_batch
+        )
+    processor.detect_batch = timer.wrap("detect_other", processor.detect_batch)
+    if getattr(processor, "motion_gate", None) is not None:
+        processor.motion_gate.regions = timer.wrap(
+            "motion", processor.motion_gate.regions
+        )
+    processor.tracker.update_with_detections = timer.wrap(
+        "tracking", processor.tracker.update_with_detections
+    )
+    processor.propagator.predict = timer.wrap(
+        "propagation", processor.propagator.predict
+    )
+    processor.zone_index.trigger = timer.wrap("zones", processor.zone_index.trigger)
+    processor.detections_manager.update_masks = timer.wrap(
+        "counting", processor.detections_manager.update_masks
+    )
+    processor.annotate_frame = timer.wrap("annotation", processor.annotate_frame)
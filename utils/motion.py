@@ -0,0 +1,148 @@
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import supervision as sv
+
+from utils.roi import intersects_region
+
+DetectRegions = Callable[[List[np.ndarray], List[np.ndarray]], List[sv.Detections]]
+
+
+def bounding_region(boxes: np.ndarray) -> np.ndarray:
+    """
+    Smallest `(x_min, y_min, x_max, y_max)` region containing all `boxes`.
+    """
+    return np.concatenate([boxes[:, :2].min(axis=0), boxes[:, 2:].max(axis=0)])
+
+
+class MotionGate:
+    """
+    Cheap pre-pass that tells the detector where to look. Moving areas are
+    found by background subtraction on downscaled keyframes, which marks
+    whole vehicles rather than only their edges, whatever their colour and
+    speed. The boxes of recent detections are kept as well, so vehicles that
+    stop (at a light, in a queue) and fade into the background are still
+    detected and keep their tracks. Frames with neither are not sent to the
+    detector at all.
+
+    Parameters:
+    -----------
+    resolution_wh : Tuple[int, int]
+        Resolution of the frames.
+    region : Optional[np.ndarray]
+        Only motion inside this `(x_min, y_min, x_max, y_max)` region, e.g.
+        the ROI around the zones, matters.
+    hold : int
+        Keyframes a detection keeps its area under watch after it was last
+        seen; matching the tracker's lost-track buffer keeps every track
+        ByteTrack could still recover.
+    margin : int
+        Pixels added around every motion and detection box, so vehicles
+        are never cut at the border of the area sent to the detector.
+    history : int
+        Keyframes the background model is learnt over.
+    threshold : float
+        Squared distance to the background model for a pixel to be moving.
+    min_area : int
+        Smallest moving blob, in pixels of the downscaled frame.
+    motion_width : int
+        Width the frames are downscaled to before background subtraction.
+    """
+
+    def __init__(
+        self,
+        resolution_wh: Tuple[int, int],
+        region: Optional[np.ndarray] = None,
+        hold: int = 30,
+        margin: int = 48,
+        history: int = 500,
+        threshold: float = 16,
+        min_area: int = 4,
+        motion_width: int = 320,
+    ) -> None:
+        width, height = resolution_wh
+        self.region = np.array([0, 0, width, height]) if region is None else region
+        self.hold = hold
+        self.margin = margin
+        self.min_area = min_area
+        self.motion_width = min(motion_width, width)
+        self.scale = width / self.motion_width
+        self.kernel = np.ones((3, 3), dtype=np.uint8)
+        self.skipped = 0
+        self.background = cv2.createBackgroundSubtractorMOG2(
+            history, threshold, detectShadows=False
+        )
+        self._started = False
+        self._recent = np.empty((0, 4))
+        self._age = np.empty(0, dtype=int)
+
+    def motion_boxes(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Boxes around the areas that differ from the background, in frame
+        coordinates. The first frame, before any background is known, is all
+        motion.
+        """
+        height = max(1, round(frame.shape[0] / self.scale))
+        small = cv2.resize(
+            frame, (self.motion_width, height), interpolation=cv2.INTER_AREA
+        )
+        mask = self.background.apply(small)
+        if not self._started:
+            self._started = True
+            return self.region[None].astype(float)
+        mask = cv2.dilate(mask, self.kernel, iterations=2)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        stats = stats[1:][stats[1:, cv2.CC_STAT_AREA] >= self.min_area]
+        x, y = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+        w, h = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+        return np.stack([x, y, x + w, y + h], axis=1).reshape(-1, 4) * self.scale
+
+    def regions(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Boxes the detector has to look at on `frame`: motion plus recent
+        detections, grown by `margin` and clipped to `region`. Empty when
+        the frame can be skipped.
+        """
+        boxes = np.concatenate([self.motion_boxes(frame), self._recent])
+        boxes = boxes + np.array([-1, -1, 1, 1]) * self.margin
+        boxes = boxes[intersects_region(boxes, self.region)]
+        boxes[:, :2] = np.maximum(boxes[:, :2], self.region[:2])
+        boxes[:, 2:] = np.minimum(boxes[:, 2:], self.region[2:])
+        return boxes.astype(int)
+
+    def observe(self, detections: sv.Detections) -> None:
+        """
+        Record the detections of the last keyframe.
+        """
+        self._age += 1
+        keep = self._age <= self.hold
+        self._recent = np.concatenate([self._recent[keep], detections.xyxy])
+        self._age = np.concatenate([self._age[keep], np.zeros(len(detections), int)])
+
+    def detect_batch(
+        self, frames: List[np.ndarray], detect_regions: DetectRegions
+    ) -> List[sv.Detections]:
+        """
+        Run `detect_regions(frames, regions)` on the frames that have
+        anything to look at, with the regions of each; the other frames get
+        empty detections. The regions of a whole batch are computed before
+        detecting, so they include the detections of earlier batches only.
+        """
+        regions = [self.regions(frame) for frame in frames]
+        active = [index for index, boxes in enumerate(regions) if len(boxes)]
+        detections = iter(
+            detect_regions(
+                [frames[index] for index in active],
+                [regions[index] for index in active],
+            )
+            if active
+            else []
+        )
+        self.skipped += len(frames) - len(active)
+        detections_batch = []
+        for boxes in regions:
+            frame_detections = next(detections) if len(boxes) else sv.Detections.empty()
+            self.observe(frame_detections)
+            detections_batch.append(frame_detections)
+        return detections_batch
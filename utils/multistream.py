@@ -0,0 +1,371 @@
+import json
+import os
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import supervision as sv
+from tqdm import tqdm
+
+from utils.checkpoint import load_checkpoint, save_checkpoint, set_state
+from utils.counting import ZoneCounter
+from utils.detection_cache import DetectionCache, cache_key
+from utils.frames import frame_range, read_frames, video_digest
+from utils.pipeline import chunked, run_pipelined, run_sequential
+from utils.reporting import CountsWriter
+from utils.sinks import open_video_sink
+from utils.zones import scale_resolution
+
+DetectBatch = Callable[[List[np.ndarray]], List[sv.Detections]]
+
+
+class StreamState(ZoneCounter):
+    """
+    Everything one camera needs besides the detector: its frame source and
+    outputs, and the tracking and counting of its own `ZoneCounter`.
+
+    Parameters:
+    -----------
+    name : str
+        Name of the stream, also the default prefix of its counts file.
+    source_video_path : str
+        Video file or stream URL readable by OpenCV.
+    zones_in, zones_out : List[np.ndarray]
+        In and out zone polygons of this camera, in source frame coordinates.
+    counts_path : str
+        JSON lines file receiving the counting events and final counts.
+    target_video_path : Optional[str]
+        Annotated video output, or None for counting only.
+    lost_track_buffer : int
+        Passed to ByteTrack; also bounds how long per-track state is kept.
+    start, end, stride : float, Optional[float], int
+        Process every `stride`-th frame from `start` to `end` seconds.
+    detect_stride : int
+        Run the detector on every `detect_stride`-th frame only, and move
+        the tracks along in between, see `KeyframeScheduler`.
+    adaptive_stride : bool
+        Lower the detection stride while the scene is moving.
+    process_scale : float
+        Resize frames by this factor right after decoding; zones are scaled
+        along.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        source_video_path: str,
+        zones_in: List[np.ndarray],
+        zones_out: List[np.ndarray],
+        counts_path: str,
+        target_video_path: Optional[str] = None,
+        lost_track_buffer: int = 30,
+        start: float = 0.0,
+        end: Optional[float] = None,
+        stride: int = 1,
+        detect_stride: int = 1,
+        adaptive_stride: bool = False,
+        process_scale: float = 1.0,
+    ) -> None:
+        self.name = name
+        self.source_video_path = source_video_path
+        self.counts_path = counts_path
+        self.target_video_path = target_video_path
+
+        self.video_info = sv.VideoInfo.from_video_path(source_video_path)
+        self.frame_range = frame_range(self.video_info, start, end, stride)
+        # Frames of `frame_range` already processed, when resuming
+        self.position = 0
+        self.frame_rate = self.video_info.fps / stride
+        self.resolution_wh = scale_resolution(
+            self.video_info.resolution_wh, process_scale
+        )
+        scale = np.array(self.resolution_wh) / self.video_info.resolution_wh
+        super().__init__(
+            [np.round(zone * scale).astype(int) for zone in zones_in],
+            [np.round(zone * scale).astype(int) for zone in zones_out],
+            self.resolution_wh,
+            self.frame_rate,
+            lost_track_buffer=lost_track_buffer,
+            detect_stride=detect_stride,
+            adaptive_stride=adaptive_stride,
+        )
+        self.detection_cache: Optional[DetectionCache] = None
+
+    @classmethod
+    def from_config(
+        cls,
+        config: Dict,
+        headless: bool = False,
+        start: float = 0.0,
+        end: Optional[float] = None,
+        stride: int = 1,
+        **options: Any,
+    ) -> "StreamState":
+        """
+        Stream described by `config`, whose `start`, `end` and `stride`
+        override those given here. With `headless`, its video output is
+        skipped. `options` are passed on to the constructor.
+        """
+        return cls(
+            name=config["name"],
+            source_video_path=config["source_video_path"],
+            zones_in=[np.array(polygon) for polygon in config["zones_in"]],
+            zones_out=[np.array(polygon) for polygon in config["zones_out"]],
+            counts_path=config.get("counts_path", f"{config['name']}_counts.jsonl"),
+            target_video_path=None if headless else config.get("target_video_path"),
+            start=config.get("start", start),
+            end=config.get("end", end),
+            stride=config.get("stride", stride),
+            **options,
+        )
+
+    def read_frames(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Source frame number and frame, resized to `resolution_wh`, of the
+        frames of `frame_range` from `position` on.
+        """
+        frame_indices = self.frame_range[self.position :]
+        frames = read_frames(self.source_video_path, frame_indices)
+        for frame_index, frame in zip(frame_indices, frames):
+            if (frame.shape[1], frame.shape[0]) != self.resolution_wh:
+                frame = cv2.resize(
+                    frame, self.resolution_wh, interpolation=cv2.INTER_AREA
+                )
+            yield frame_index, frame
+
+
+class MultiStreamRunner:
+    """
+    Serves several cameras with a single detector. Every round takes the
+    next frame of each stream that still has frames, runs the keyframes of
+    all of them through the detector in one call, then hands each stream
+    its own detections, so trackers and counts stay independent per camera.
+
+    Parameters:
+    -----------
+    detect_batch : DetectBatch
+        The detector, e.g. one of `utils.detectors`.
+    streams : List[StreamState]
+        Cameras to serve.
+    sink_options : Optional[Dict[str, Any]]
+        Options of `open_video_sink` for the annotated videos.
+    detection_cache_dir : Optional[str]
+        Keep the detections of every stream in a `DetectionCache` under this
+        directory, and read them back instead of detecting again.
+    checkpoint_path : Optional[str]
+        Save the state of every stream and how far its counts file got to
+        this file every `checkpoint_interval` seconds of video. Only for
+        streams without video output.
+    resume : bool
+        Continue from the checkpoint at `checkpoint_path`, if there is one.
+    """
+
+    def __init__(
+        self,
+        detect_batch: DetectBatch,
+        streams: List[StreamState],
+        sink_options: Optional[Dict[str, Any]] = None,
+        detection_cache_dir: Optional[str] = None,
+        checkpoint_path: Optional[str] = None,
+        checkpoint_interval: float = 300.0,
+        resume: bool = False,
+    ) -> None:
+        self.detect_batch = detect_batch
+        self.streams = streams
+        self.sink_options = sink_options or {}
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        if checkpoint_path is not None and any(
+            stream.target_video_path for stream in streams
+        ):
+            raise ValueError("Checkpoints are only saved for streams without video")
+        # A round takes one frame of every stream, so checkpoints are saved
+        # every this many rounds
+        self.checkpoint_rounds = max(
+            1,
+            round(checkpoint_interval * max(stream.frame_rate for stream in streams)),
+        )
+        if detection_cache_dir is not None:
+            detector = getattr(
+                detect_batch, "cache_settings", type(detect_batch).__name__
+            )
+            for stream in streams:
+                settings = dict(
+                    video=video_digest(stream.source_video_path),
+                    detector=detector,
+                    resolution_wh=stream.resolution_wh,
+                    roi=None,
+                    slice_wh=None,
+                    motion_gate=False,
+                )
+                stream.detection_cache = DetectionCache(
+                    os.path.join(detection_cache_dir, cache_key(settings)), settings
+                )
+
+    def rounds(self) -> Iterator[List[Tuple[StreamState, int, np.ndarray]]]:
+        frames = {id(stream): stream.read_frames() for stream in self.streams}
+        live = list(self.streams)
+        while live:
+            batch = []
+            for stream in list(live):
+                item = next(frames[id(stream)], None)
+                if item is None:
+                    live.remove(stream)
+                else:
+                    batch.append((stream, *item))
+            if batch:
+                yield batch
+
+    def detect_round(
+        self, batch: List[Tuple[StreamState, int, np.ndarray]]
+    ) -> List[Tuple[StreamState, np.ndarray, Optional[sv.Detections]]]:
+        detections_batch: List[Optional[sv.Detections]] = [None] * len(batch)
+        missing = []
+        for i, (stream, frame_index, frame) in enumerate(batch):
+            if not stream.scheduler.is_keyframe(frame):
+                continue
+            if stream.detection_cache is not None:
+                detections_batch[i] = stream.detection_cache.get(frame_index)
+            if detections_batch[i] is None:
+                missing.append(i)
+        if missing:
+            detected = self.detect_batch([batch[i][2] for i in missing])
+            for i, detections in zip(missing, detected):
+                stream, frame_index, _ = batch[i]
+                if stream.detection_cache is not None:
+                    stream.detection_cache.put(frame_index, detections)
+                detections_batch[i] = detections
+        return [
+            (stream, frame, detections)
+            for (stream, _, frame), detections in zip(batch, detections_batch)
+        ]
+
+    @staticmethod
+    def track_round(
+        items: List[Tuple[StreamState, np.ndarray, Optional[sv.Detections]]],
+    ) -> List[Tuple[StreamState, np.ndarray, sv.Detections, List]]:
+        results = []
+        for stream, frame, detections in items:
+            detections = stream.update_tracks(detections)
+            events = stream.detections_manager.events
+            if stream.target_video_path:
+                frame = stream.annotate_frame(frame, detections)
+            results.append((stream, frame, detections, events))
+        return results
+
+    def run(self, pipeline: bool = False, queue_size: int = 4) -> None:
+        checkpoint = None
+        if self.resume and self.checkpoint_path is not None:
+            checkpoint = self.load_checkpoint()
+        offsets = [None] * len(self.streams)
+        if checkpoint is not None:
+            offsets = [saved["counts_offset"] for saved in checkpoint["streams"]]
+
+        stages = [self.detect_round, self.track_round]
+        # With checkpoints, rounds go through the stages in chunks, and every
+        # chunk is finished by all of them before its checkpoint is saved
+        chunks = [self.rounds()]
+        if self.checkpoint_path is not None:
+            chunks = chunked(self.rounds(), self.checkpoint_rounds)
+
+        with ExitStack() as stack:
+            writers = {}
+            for stream, offset in zip(self.streams, offsets):
+                writer = CountsWriter(stream.counts_path, stream.frame_range, offset)
+                writers[id(stream)] = stack.enter_context(writer)
+                writer.frame_index = stream.position
+            sinks = {
+                id(stream): stack.enter_context(
+                    open_video_sink(
+                        stream.target_video_path,
+                        sv.VideoInfo(*stream.resolution_wh, stream.frame_rate),
+                        **self.sink_options,
+                    )
+                )
+                for stream in self.streams
+                if stream.target_video_path
+            }
+            progress = stack.enter_context(tqdm(unit="round"))
+            for chunk in chunks:
+                if pipeline:
+                    results = run_pipelined(chunk, stages, queue_size)
+                else:
+                    results = run_sequential(chunk, stages)
+                for items in results:
+                    for stream, frame, _, events in items:
+                        writers[id(stream)].write_events(events)
+                        if id(stream) in sinks:
+                            sinks[id(stream)].write_frame(frame)
+                    progress.update()
+                if self.checkpoint_path is not None:
+                    self.save_checkpoint(writers)
+            for stream in self.streams:
+                writers[id(stream)].write_counts(stream.detections_manager.snapshot())
+        for stream in self.streams:
+            if stream.detection_cache is not None:
+                stream.detection_cache.flush()
+        if self.checkpoint_path is not None and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def save_checkpoint(self, writers: Dict[int, CountsWriter]) -> None:
+        streams = []
+        for stream in self.streams:
+            if stream.detection_cache is not None:
+                stream.detection_cache.flush()
+            writer = writers[id(stream)]
+            streams.append(
+                dict(
+                    source_video_path=stream.source_video_path,
+                    frames=stream.frame_range,
+                    position=writer.frame_index,
+                    counts_offset=writer.tell(),
+                    state=stream.checkpoint_state(),
+                )
+            )
+        save_checkpoint(
+            self.checkpoint_path,
+            dict(checkpoint_rounds=self.checkpoint_rounds, streams=streams),
+        )
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """
+        Restore the state of every stream saved at `checkpoint_path` and
+        return the checkpoint, or None when there is none yet.
+        """
+        checkpoint = load_checkpoint(self.checkpoint_path)
+        if checkpoint is None:
+            return None
+        saved_for = [
+            (saved["source_video_path"], saved["frames"])
+            for saved in checkpoint["streams"]
+        ]
+        streams = [
+            (stream.source_video_path, stream.frame_range) for stream in self.streams
+        ]
+        if (
+            saved_for != streams
+            or checkpoint["checkpoint_rounds"] != self.checkpoint_rounds
+        ):
+            raise ValueError(
+                f"Checkpoint {self.checkpoint_path} was saved for other streams "
+                "or another checkpoint interval"
+            )
+        for stream, saved in zip(self.streams, checkpoint["streams"]):
+            stream.position = saved["position"]
+            for name, state in saved["state"].items():
+                set_state(getattr(stream, name), state)
+        return checkpoint
+
+
+def load_streams(config_path: str, **options: Any) -> List[StreamState]:
+    """
+    Build the streams listed in a JSON config file of the form
+    `{"streams": [{"name": ..., "source_video_path": ..., "zones_in": [...],
+    "zones_out": [...], "counts_path": ..., "target_video_path": ...}]}`.
+    A stream may set its own `start`, `end` and `stride`, overriding the
+    ones in `options`, which are passed on to `StreamState.from_config`.
+    """
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+    return [StreamState.from_config(stream, **options) for stream in config["streams"]]
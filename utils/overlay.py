@@ -0,0 +1,88 @@
+from typing import Callable, Hashable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+DrawStatic = Callable[[np.ndarray], np.ndarray]
+
+
+def polygons_key(polygons: List[np.ndarray]) -> Tuple[bytes, ...]:
+    """
+    Cache key that changes whenever any of the polygons does.
+    """
+    return tuple(np.asarray(polygon).tobytes() for polygon in polygons)
+
+
+def _as_pixels(image: np.ndarray) -> np.ndarray:
+    """
+    View a contiguous image as a flat array with one element per pixel, so a
+    whole pixel is moved by a single indexed assignment.
+    """
+    channels = image.shape[-1]
+    return image.reshape(-1, channels).view(np.dtype((np.void, channels))).ravel()
+
+
+class StaticOverlay:
+    """
+    Annotations that look the same on every frame, such as zone outlines and
+    dashboard panels, rendered once and then copied onto each frame.
+
+    `draw` is called on two blank canvases, one black and one white, and the
+    pixels it touched are found by comparing them, so any drawing colour
+    (black included) and anti-aliased edges are supported. Solid areas such
+    as filled panels are copied as whole rectangles; sparse strokes such as
+    zone outlines are written as one list of pixels. The overlay is rendered
+    again only when the frame shape or the `key` passed to `apply` changes,
+    e.g. when the zones are edited.
+    """
+
+    def __init__(self, draw: DrawStatic) -> None:
+        self.draw = draw
+        self._key: Optional[Hashable] = None
+        self._rectangles: List[Tuple[Tuple[slice, slice], np.ndarray]] = []
+        self._pixels = np.empty(0, dtype=np.intp)
+        self._colors = np.empty((0, 3), dtype=np.uint8)
+        self._alpha: Optional[np.ndarray] = None
+
+    def _render(self, shape: Tuple[int, ...]) -> None:
+        dark = self.draw(np.zeros(shape, dtype=np.uint8))
+        light = self.draw(np.full(shape, 255, dtype=np.uint8))
+        alpha = 1 - (light.astype(np.int16) - dark).max(axis=2) / 255
+        touched = (alpha > 0).astype(np.uint8)
+
+        self._rectangles = []
+        _, _, stats, _ = cv2.connectedComponentsWithStats(touched, connectivity=8)
+        for x, y, w, h, area in stats[1:]:
+            region = (slice(y, y + h), slice(x, x + w))
+            if area == w * h and np.all(alpha[region] == 1):
+                self._rectangles.append((region, dark[region].copy()))
+                touched[region] = 0
+
+        self._pixels = np.flatnonzero(touched)
+        alpha = alpha.reshape(-1)[self._pixels, None]
+        colors = dark.reshape(-1, shape[2])[self._pixels]
+        if np.all(alpha == 1):
+            self._alpha = None
+            self._colors = _as_pixels(colors)
+        else:
+            # `dark` already holds the colour premultiplied by its coverage
+            self._alpha = alpha
+            self._colors = colors.astype(np.float32)
+
+    def apply(self, frame: np.ndarray, key: Hashable = None) -> np.ndarray:
+        """
+        Draw the static content on `frame` (which must be contiguous) in
+        place and return it.
+        """
+        if self._key != (frame.shape, key):
+            self._render(frame.shape)
+            self._key = (frame.shape, key)
+        for region, colors in self._rectangles:
+            frame[region] = colors
+        if self._alpha is None:
+            _as_pixels(frame)[self._pixels] = self._colors
+        else:
+            pixels = frame.reshape(-1, frame.shape[2])
+            blended = pixels[self._pixels] * (1 - self._alpha) + self._colors
+            pixels[self._pixels] = blended.astype(np.uint8)
+        return frame
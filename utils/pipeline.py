@@ -0,0 +1,157 @@
+import itertools
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+Stage = Callable[[Any], Any]
+
+_END = object()
+
+
+class _StageFailure:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def run_sequential(items: Iterable[Any], stages: List[Stage]) -> Iterator[Any]:
+    """
+    Push every item through all stages on the calling thread.
+    """
+    for item in items:
+        for stage in stages:
+            item = stage(item)
+        yield item
+
+
+def run_pipelined(
+    items: Iterable[Any],
+    stages: List[Stage],
+    queue_size: int = 4,
+    metrics: Optional[Any] = None,
+) -> Iterator[Any]:
+    """
+    Run the source iterator and every stage on its own thread, connected by
+    bounded FIFO queues, and yield the results of the last stage.
+
+    Each stage is served by exactly one thread, so items leave every stage in
+    the order they entered it and stateful stages (e.g. the tracker) see frames
+    in source order. Iterating the source happens on its own thread, which
+    moves video decoding off the consumer thread.
+
+    Parameters:
+    -----------
+    items : Iterable[Any]
+        Source of items, typically a frame generator.
+    stages : List[Callable[[Any], Any]]
+        Callables applied in order, each receiving the previous stage output.
+    queue_size : int
+        Capacity of every inter-stage queue.
+    metrics : Optional[Metrics]
+        Reports the depth of every queue, the input queue of stage `i` as
+        `queue_depth{queue="i"}`.
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    if metrics is not None:
+        for i, q in enumerate(queues):
+            metrics.add_gauge("queue_depth", q.qsize, queue=str(i))
+
+    def put(q: queue.Queue, item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q: queue.Queue) -> Any:
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(queues[0], item):
+                    return
+        except BaseException as error:
+            put(queues[0], _StageFailure(error))
+            return
+        put(queues[0], _END)
+
+    def work(stage: Stage, q_in: queue.Queue, q_out: queue.Queue) -> None:
+        while True:
+            item = get(q_in)
+            if item is _END or isinstance(item, _StageFailure):
+                put(q_out, item)
+                return
+            try:
+                result = stage(item)
+            except BaseException as error:
+                put(q_out, _StageFailure(error))
+                return
+            if not put(q_out, result):
+                return
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    for i, stage in enumerate(stages):
+        threads.append(
+            threading.Thread(
+                target=work, args=(stage, queues[i], queues[i + 1]), daemon=True
+            )
+        )
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = get(queues[-1])
+            if item is _END:
+                break
+            if isinstance(item, _StageFailure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def batched(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """
+    Group consecutive items into lists of at most `batch_size` elements.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def chunked(items: Iterable[Any], chunk_size: int) -> Iterator[Iterator[Any]]:
+    """
+    Split `items` into consecutive iterators of at most `chunk_size` items,
+    without materializing them. Each chunk must be exhausted before the next
+    one is requested.
+    """
+    iterator = iter(items)
+    for first in iterator:
+        yield itertools.chain([first], itertools.islice(iterator, chunk_size - 1))
+
+
+def unbatched(batches: Iterator[List[Any]]) -> Iterator[Any]:
+    """
+    Flatten a stream of batches, closing the underlying stream when stopped.
+    """
+    try:
+        for batch in batches:
+            yield from batch
+    finally:
+        batches.close()
@@ -1,9 +1,14 @@
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 import numpy as np
 from tqdm import tqdm
-from ultralytics import YOLO
 import supervision as sv
+from utils.export import load_yolo
+from utils.frames import frame_range, read_frames
 from utils.managerDetecs import DetMan
+from utils.pipeline import batched, run_pipelined, run_sequential, unbatched
+from utils.roi import crop_to_region, offset_detections, zones_region
+from utils.stride import KeyframeScheduler, TrackPropagator
+from utils.zones import ZoneIndex
 
 POLYGONS = [
     np.array([[2038, 444], [2775, 1108], [2062, 1963], [1332, 1211]])
@@ -16,62 +21,116 @@ class Processor:
         source_weights_path: str,
         source_video_path: str,
         workingDirectory: str,
-        confidence_threshold: float = 0.3
+        confidence_threshold: float = 0.3,
+        pipeline: bool = False,
+        queue_size: int = 4,
+        batch_size: int = 1,
+        roi_margin: int = None,
+        detect_stride: int = 1,
+        adaptive_stride: bool = False,
+        lost_track_buffer: int = 30,
+        start: float = 0.0,
+        end: float = None,
+        stride: int = 1,
+        backend: str = "pytorch",
+        imgsz: int = 640,
+        int8: bool = False,
+        export_dir: str = None
     ) -> None:
-        self.model = YOLO(source_weights_path)
+        # ONNX and OpenVINO exports are cached next to the weights after the first run
+        self.model = load_yolo(
+            source_weights_path, backend, imgsz, int8, source_video_path, export_dir
+        )
+        self.imgsz = imgsz
         #self.model.to('cuda')
         self.source_video_path = source_video_path
         self.conf_threshold = confidence_threshold
         self.workingDirectory = workingDirectory
         self.countFrames = 0
         self.framesSpeed = 10
+        self.pipeline = pipeline
+        self.queue_size = queue_size
+        self.batch_size = batch_size
 
-        self.tracker = sv.ByteTrack()
         self.video_info = sv.VideoInfo.from_video_path(source_video_path)
+        # Only every stride-th frame of [start, end) is decoded and processed
+        self.frames = frame_range(self.video_info, start, end, stride)
+        self.frame_rate = self.video_info.fps / stride
+        # The tracker is only updated on keyframes when detect_stride > 1
+        self.tracker = sv.ByteTrack(
+            lost_track_buffer=lost_track_buffer,
+            frame_rate=self.frame_rate / detect_stride
+        )
+        self.scheduler = KeyframeScheduler(detect_stride, adaptive_stride)
+        self.propagator = TrackPropagator()
+        # Only detections whose center lands in POLYGONS matter, so inference can be
+        # restricted to the polygons plus a margin for vehicles approaching them
+        self.roi = None
+        if roi_margin is not None:
+            self.roi = zones_region(POLYGONS, self.video_info.resolution_wh, roi_margin)
 
         pol = sv.PolygonZone(
             polygon=POLYGONS[0],
-            frame_resolution_wh=self.video_info.resolution_wh,
-            triggering_anchors=sv.Position.CENTER
+            triggering_anchors=[sv.Position.CENTER]
         )
         self.zones_in = [pol]
+        self.zone_index = ZoneIndex(POLYGONS, self.video_info.resolution_wh, sv.Position.CENTER)
 
         self.box_annotator = sv.BoxAnnotator(color=COLORS)
         self.trace_annotator = sv.TraceAnnotator(
             position=sv.Position.CENTER, trace_length=100, thickness=2
         )
-        self.detections_manager = DetMan()
+        # Keep per-track state only as long as ByteTrack may still bring the track back
+        self.detections_manager = DetMan(
+            self.frame_rate,
+            max_lost_frames=self.tracker.max_time_lost * detect_stride + 1
+        )
 
 
-    def process_frame(self, frame: np.ndarray) -> np.ndarray:
-        self.countFrames += 1
-        results = self.model(frame, verbose=False, conf=self.conf_threshold)[0]
-        detections = sv.Detections.from_ultralytics(results)
-        # this add additional id for the detections
-        detections = self.tracker.update_with_detections(detections)
-
-        detections_in_zones = []
+    def detect_batch(self, frames: List[np.ndarray]) -> List[sv.Detections]:
+        if self.roi is not None:
+            frames = [crop_to_region(frame, self.roi) for frame in frames]
+        results = self.model(frames, verbose=False, conf=self.conf_threshold, imgsz=self.imgsz)
+        detectionsBatch = [sv.Detections.from_ultralytics(result) for result in results]
+        if self.roi is not None:
+            for detections in detectionsBatch:
+                offset_detections(detections, self.roi)
+        return detectionsBatch
 
-        for _, zIn in enumerate(self.zones_in):
-            # here I can print the detections (whole ones) and detections_in_zone to see if its working
-            detections_in_zone = detections[zIn.trigger(detections=detections)]
-            detections_in_zones.append(detections_in_zone)
+    def detect(self, frame: np.ndarray) -> sv.Detections:
+        return self.detect_batch([frame])[0]
 
-        # detections is just a Detections object
-        # detections_in_zones is a List<Detections>, but just 1 element
-        
-        # We call the detection manager with all detections and detections in rectangle (Detections and List<Detections>)
-        detections = self.detections_manager.update(
-            detections, detections_in_zones
-        )
-        annotated_frame = self.annotate_frame(frame, detections)
+    def track(self, detections: Optional[sv.Detections]) -> Tuple[sv.Detections, int]:
+        self.countFrames += 1
+        if detections is None:
+            # frame skipped by the detector, move the tracks along their velocity
+            detections = self.propagator.predict()
+        else:
+            # this add additional id for the detections
+            detections = self.tracker.update_with_detections(detections)
+            # without skipped frames there is nothing to propagate
+            if self.scheduler.max_stride > 1:
+                self.propagator.update(detections)
+
+        # One boolean per detection, True when its center is inside the polygon
+        in_zone = self.zone_index.trigger(detections)[:, 0]
+
+        # We call the detection manager with all detections and their zone membership
+        detections = self.detections_manager.update_mask(detections, in_zone)
         if self.countFrames % self.framesSpeed == 1:
             self.detections_manager.update_positions(detections)
-        return annotated_frame
+        return detections, self.detections_manager.count_inside
+
+    def process_frame(self, frame: np.ndarray) -> np.ndarray:
+        detections, count = self.track(self.detect(frame))
+        return self.annotate_frame(frame, detections, count)
         
 
-    def annotate_frame(self, frame: np.ndarray, detections: sv.Detections) -> np.ndarray:
-        annotated_frame = frame.copy()
+    def annotate_frame(self, frame: np.ndarray, detections: sv.Detections, count: int = None) -> np.ndarray:
+        if count is None:
+            count = self.detections_manager.count_inside
+        # Draw straight on the decoded frame, which is not used after annotation
+        annotated_frame = frame
 
         # Initialize the labels list
         labels = []
@@ -91,7 +150,6 @@ class Processor:
             )
 
         # Draw count of vehicles inside the rectangle
-        count = self.detections_manager.count_inside
         zone_center = sv.get_polygon_center(polygon=self.zones_in[0].polygon)
         text_anchor = sv.Point(x=zone_center.x, y=zone_center.y + 40)
         annotated_frame = sv.draw_text(
@@ -118,12 +176,26 @@ class Processor:
             Confidence threshold for the model to filter weak detections.
         """
         
-        frameGenerator = sv.get_video_frames_generator(self.source_video_path)
+        frameGenerator = read_frames(self.source_video_path, self.frames)
+        frameBatches = batched(frameGenerator, self.batch_size)
+        stages = [
+            lambda frames: list(
+                zip(frames, self.scheduler.detect_batch(frames, self.detect_batch))
+            ),
+            lambda items: [(frame, *self.track(dets)) for frame, dets in items],
+            lambda items: [self.annotate_frame(*item) for item in items],
+        ]
+        if self.pipeline:
+            batches = run_pipelined(frameBatches, stages, self.queue_size)
+        else:
+            batches = run_sequential(frameBatches, stages)
+        annotatedFrames = unbatched(batches)
 
         output_video_path = f"{workingDirectory}/output_video.mp4"
-        output_video_info = sv.VideoInfo.from_video_path(self.source_video_path)
+        output_video_info = sv.VideoInfo(
+            *self.video_info.resolution_wh, self.frame_rate, len(self.frames)
+        )
 
         with sv.VideoSink(output_video_path, output_video_info) as sink:
-            for frame in tqdm(frameGenerator, total=output_video_info.total_frames):
-                annotated_frame = self.process_frame(frame)
-                sink.write_frame(annotated_frame)
\ No newline at end of file
+            for annotated_frame in tqdm(annotatedFrames, total=output_video_info.total_frames):
+                sink.write_frame(annotated_frame)
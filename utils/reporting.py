@@ -0,0 +1,85 @@
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+
+class CountsWriter:
+    """
+    Writes counting results as JSON lines. Every vehicle counted on its way
+    from an in zone to an out zone produces an `event` record as soon as it
+    happens, and the final per-zone totals are written as a `counts` record
+    when the writer is closed. Frames are numbered in the source video: when
+    only a range of it is processed, pass that range as `frames`. To continue
+    the file of a checkpointed run, pass the `tell` of the checkpoint as
+    `offset`: whatever was written after it is dropped.
+
+    Example output:
+        {"type": "event", "frame": 812, "tracker_id": 57, "zone_in": 2, "zone_out": 0}
+        {"type": "counts", "frames": 9000, "counts": {"0": {"2": 14}}}
+    """
+
+    def __init__(
+        self, path: str, frames: Optional[range] = None, offset: Optional[int] = None
+    ) -> None:
+        self.path = path
+        self.frames = frames
+        self.offset = offset
+        self.frame_index = 0
+        self._file = None
+
+    def __enter__(self) -> "CountsWriter":
+        if self.offset is None:
+            self._file = open(self.path, "w")
+        else:
+            self._file = open(self.path, "r+")
+            self._file.truncate(self.offset)
+            self._file.seek(self.offset)
+        return self
+
+    def tell(self) -> int:
+        """
+        Size of the records written so far, once they are safely on disk.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def write_events(self, events: List[Tuple[int, int, int]]) -> None:
+        """
+        Record the `(tracker_id, zone_in_id, zone_out_id)` events of the
+        next frame.
+        """
+        frame = self.frame_index
+        if self.frames is not None:
+            frame = self.frames[self.frame_index]
+        for tracker_id, zone_in_id, zone_out_id in events:
+            self.write_event(frame, tracker_id, zone_in_id, zone_out_id)
+        self.frame_index += 1
+
+    def write_event(
+        self, frame_index: int, tracker_id: int, zone_in_id: int, zone_out_id: int
+    ) -> None:
+        record = {
+            "type": "event",
+            "frame": int(frame_index),
+            "tracker_id": int(tracker_id),
+            "zone_in": int(zone_in_id),
+            "zone_out": int(zone_out_id),
+        }
+        self._file.write(json.dumps(record) + "\n")
+
+    def write_counts(self, counts: Dict[int, Dict[int, int]]) -> None:
+        record = {
+            "type": "counts",
+            "frames": self.frame_index,
+            "counts": {
+                str(zone_out_id): {
+                    str(zone_in_id): int(count) for zone_in_id, count in row.items()
+                }
+                for zone_out_id, row in counts.items()
+            },
+        }
+        self._file.write(json.dumps(record) + "\n")
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._file.close()
@@ -0,0 +1,68 @@
+import dataclasses
+from typing import List, Tuple
+
+import numpy as np
+import supervision as sv
+
+
+def zones_region(
+    polygons: List[np.ndarray], resolution_wh: Tuple[int, int], margin: int = 0
+) -> np.ndarray:
+    """
+    Bounding region `(x_min, y_min, x_max, y_max)` of all zone polygons,
+    grown by `margin` pixels on every side and clipped to the frame.
+
+    Parameters:
+    -----------
+    polygons : List[np.ndarray]
+        Zone polygons in frame coordinates.
+    resolution_wh : Tuple[int, int]
+        Frame width and height.
+    margin : int
+        Extra pixels kept around the zones so approaching vehicles are
+        detected, and tracked, before their center reaches a zone.
+    """
+    points = np.concatenate(polygons, axis=0)
+    x_min, y_min = points.min(axis=0) - margin
+    x_max, y_max = points.max(axis=0) + margin
+    width, height = resolution_wh
+    return np.array(
+        [max(0, x_min), max(0, y_min), min(width, x_max), min(height, y_max)],
+        dtype=int,
+    )
+
+
+def crop_to_region(frame: np.ndarray, region: np.ndarray) -> np.ndarray:
+    x_min, y_min, x_max, y_max = region
+    return frame[y_min:y_max, x_min:x_max]
+
+
+def offset_detections(detections: sv.Detections, region: np.ndarray) -> sv.Detections:
+    """
+    Move detections found in a crop back into full-frame coordinates.
+    """
+    detections.xyxy = detections.xyxy + np.tile(region[:2], 2)
+    return detections
+
+
+def scale_detections(
+    detections: sv.Detections, scale_xy: Tuple[float, float]
+) -> sv.Detections:
+    """
+    Copy of `detections` with the boxes resized by `scale_xy`, e.g. to draw
+    detections found on a downscaled frame onto the full-resolution one.
+    """
+    return dataclasses.replace(detections, xyxy=detections.xyxy * np.tile(scale_xy, 2))
+
+
+def intersects_region(boxes: np.ndarray, region: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of the `(x_min, y_min, x_max, y_max)` boxes that overlap
+    the region.
+    """
+    return (
+        (boxes[:, 0] < region[2])
+        & (boxes[:, 2] > region[0])
+        & (boxes[:, 1] < region[3])
+        & (boxes[:, 3] > region[1])
+    )
@@ -0,0 +1,266 @@
+import math
+import multiprocessing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import supervision as sv
+
+from utils.frames import frame_range, read_frames
+from utils.managerDetecs import DetectionsManager
+from utils.pipeline import batched
+from utils.reporting import CountsWriter
+
+
+class SegmentRecorder:
+    """
+    Wraps a `DetectionsManager` and records, for every local track of a
+    segment, what the merge step needs to count it across segments: the
+    first in zone it entered, the runs of frames it spent in each out zone,
+    and its boxes on the frames shared with the neighbouring segments.
+
+    Every other attribute is forwarded to the wrapped manager.
+    """
+
+    def __init__(
+        self, manager: Any, start: int, head_end: int, tail_start: int
+    ) -> None:
+        self.manager = manager
+        self.frame_index = start
+        self.head_end = head_end
+        self.tail_start = tail_start
+        self.tracks: Dict[int, Dict] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.manager, name)
+
+    def _track(self, tracker_id: int) -> Dict:
+        return self.tracks.setdefault(
+            tracker_id, {"origin": None, "visits": {}, "boxes": {}}
+        )
+
+    def update_masks(
+        self,
+        detections_all: sv.Detections,
+        in_zones: np.ndarray,
+        out_zones: np.ndarray,
+    ) -> sv.Detections:
+        frame_index = self.frame_index
+        tracker_ids = np.asarray(detections_all.tracker_id, dtype=int)
+
+        for i in np.flatnonzero(in_zones.any(axis=1)):
+            track = self._track(int(tracker_ids[i]))
+            if track["origin"] is None:
+                track["origin"] = (frame_index, int(np.argmax(in_zones[i])))
+
+        for i, zone_out_id in zip(*np.nonzero(out_zones)):
+            visits = self._track(int(tracker_ids[i]))["visits"].setdefault(
+                int(zone_out_id), []
+            )
+            if visits and visits[-1][1] == frame_index - 1:
+                visits[-1][1] = frame_index
+            else:
+                visits.append([frame_index, frame_index])
+
+        if frame_index < self.head_end or frame_index >= self.tail_start:
+            for tracker_id, xyxy in zip(tracker_ids, detections_all.xyxy):
+                self._track(int(tracker_id))["boxes"][frame_index] = xyxy.tolist()
+
+        self.frame_index += 1
+        return self.manager.update_masks(detections_all, in_zones, out_zones)
+
+
+def plan_segments(
+    total_frames: int, workers: int, overlap: int
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Split a video into `workers` segments. Returns, per segment, the first
+    and last+1 frame it decodes and the ranges it shares with the previous
+    and next segment, as `(start, end, head_end, tail_start)`.
+    """
+    length = max(1, math.ceil(total_frames / workers))
+    segments = []
+    for start in range(0, total_frames, length):
+        owned_end = min(total_frames, start + length)
+        end = min(total_frames, owned_end + overlap)
+        head_end = min(owned_end, start + overlap) if start > 0 else start
+        segments.append((start, end, head_end, owned_end))
+    return segments
+
+
+def _process_segment(
+    factory: Callable[[], Any], segment: Tuple[int, int, int, int]
+) -> Tuple[Dict[int, Dict], Tuple[int, int]]:
+    start, end, head_end, tail_start = segment
+    processor = factory()
+    recorder = SegmentRecorder(
+        processor.detections_manager, start, head_end, tail_start
+    )
+    processor.detections_manager = recorder
+    # Behind the motion gate, detections depend on where the segment starts
+    if processor.motion_gate is not None:
+        processor.detection_cache = None
+    # Segment bounds are positions in the processor's range of source frames
+    frame_indices = processor.frames[start:end]
+    frames = read_frames(processor.source_video_path, frame_indices)
+    frames = (processor.prepare_frame(frame)[1] for frame in frames)
+    for index_batch, frame_batch in zip(
+        batched(frame_indices, processor.batch_size),
+        batched(frames, processor.batch_size),
+    ):
+        for detections in processor.detect_frames(frame_batch, index_batch):
+            processor.track(detections)
+    if processor.detection_cache is not None:
+        processor.detection_cache.flush()
+    return recorder.tracks, recorder.counts.shape
+
+
+def _box_iou(box_a: List[float], box_b: List[float]) -> float:
+    x1, y1 = max(box_a[0], box_b[0]), max(box_a[1], box_b[1])
+    x2, y2 = min(box_a[2], box_b[2]), min(box_a[3], box_b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _match_tracks(
+    earlier: Dict[int, Dict],
+    later: Dict[int, Dict],
+    iou_threshold: float,
+) -> List[Tuple[int, int]]:
+    """
+    Pair the tracks of two neighbouring segments that follow the same
+    vehicle, by mean box IoU over the frames both segments processed.
+    """
+    candidates = []
+    for id_a, track_a in earlier.items():
+        for id_b, track_b in later.items():
+            shared = track_a["boxes"].keys() & track_b["boxes"].keys()
+            if not shared:
+                continue
+            score = np.mean(
+                [_box_iou(track_a["boxes"][f], track_b["boxes"][f]) for f in shared]
+            )
+            if score >= iou_threshold:
+                candidates.append((score, id_a, id_b))
+
+    matches, used_a, used_b = [], set(), set()
+    for _, id_a, id_b in sorted(candidates, reverse=True):
+        if id_a not in used_a and id_b not in used_b:
+            matches.append((id_a, id_b))
+            used_a.add(id_a)
+            used_b.add(id_b)
+    return matches
+
+
+def merge_segments(
+    segment_tracks: List[Dict[int, Dict]], iou_threshold: float = 0.5
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Stitch the tracks of consecutive segments together and count every
+    stitched track once, with the rules of `DetectionsManager`: the origin
+    is the first in zone ever entered, and an out zone counts if the track
+    is inside it at or after that moment.
+
+    Returns `(frame, tracker_id, zone_in_id, zone_out_id)` events sorted by
+    frame, with tracker IDs renumbered over the whole video.
+    """
+    parent: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+    def find(key: Tuple[int, int]) -> Tuple[int, int]:
+        while parent.setdefault(key, key) != key:
+            key = parent[key]
+        return key
+
+    for segment, tracks in enumerate(segment_tracks):
+        for tracker_id in tracks:
+            find((segment, tracker_id))
+    for segment in range(len(segment_tracks) - 1):
+        for id_a, id_b in _match_tracks(
+            segment_tracks[segment], segment_tracks[segment + 1], iou_threshold
+        ):
+            parent[find((segment + 1, id_b))] = find((segment, id_a))
+
+    groups: Dict[Tuple[int, int], List[Dict]] = {}
+    for key in sorted(parent):
+        groups.setdefault(find(key), []).append(segment_tracks[key[0]][key[1]])
+
+    events = []
+    for global_id, pieces in enumerate(groups.values(), start=1):
+        origins = [piece["origin"] for piece in pieces if piece["origin"]]
+        if not origins:
+            continue
+        origin_frame, zone_in_id = min(origins)
+        first_hits: Dict[int, int] = {}
+        for piece in pieces:
+            for zone_out_id, visits in piece["visits"].items():
+                for first, last in visits:
+                    if last >= origin_frame:
+                        hit = max(first, origin_frame)
+                        first_hits[zone_out_id] = min(
+                            hit, first_hits.get(zone_out_id, hit)
+                        )
+        for zone_out_id, frame in first_hits.items():
+            events.append((frame, global_id, zone_in_id, zone_out_id))
+    return sorted(events)
+
+
+def process_sharded(
+    factory: Callable[[], Any],
+    source_video_path: str,
+    workers: int,
+    overlap_seconds: float,
+    counts_path: str,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    stride: int = 1,
+) -> None:
+    """
+    Count vehicles in a long video by processing time segments in parallel
+    worker processes, then stitching the tracks across segment boundaries.
+
+    Parameters:
+    -----------
+    factory : Callable[[], Any]
+        Picklable callable building a video processor in each worker, e.g. a
+        `functools.partial` of a `VideoProcessor` class.
+    source_video_path : str
+        Video to process; workers seek straight to their first frame.
+    workers : int
+        Number of segments and worker processes.
+    overlap_seconds : float
+        Duration each segment keeps processing past its end, used to match
+        tracks with the next segment.
+    counts_path : str
+        JSON lines file receiving the merged events and counts.
+    start, end, stride : float, Optional[float], int
+        Range of source frames to process, as given to the processors built
+        by `factory`.
+    """
+    video_info = sv.VideoInfo.from_video_path(source_video_path)
+    frames = frame_range(video_info, start, end, stride)
+    overlap = int(round(overlap_seconds * video_info.fps / stride))
+    segments = plan_segments(len(frames), workers, overlap)
+
+    # An empty frame range, e.g. --start past the end, still gets a report
+    results = []
+    if segments:
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(len(segments)) as pool:
+            results = pool.starmap(
+                _process_segment, [(factory, segment) for segment in segments]
+            )
+    segment_tracks = [tracks for tracks, _ in results]
+    zones_out_count, zones_in_count = results[0][1] if results else (0, 0)
+
+    # Within a frame, events come by out zone as in a single process, and the
+    # counts go through a manager of their own, so both runs report the same
+    events = sorted(merge_segments(segment_tracks), key=lambda e: (e[0], e[3]))
+    manager = DetectionsManager(zones_in_count, zones_out_count)
+    with CountsWriter(counts_path, frames) as writer:
+        for frame, tracker_id, zone_in_id, zone_out_id in events:
+            writer.write_event(frames[frame], tracker_id, zone_in_id, zone_out_id)
+            manager.count(np.array([zone_in_id]), np.array([zone_out_id]))
+        writer.frame_index = len(frames)
+        writer.write_counts(manager.snapshot())
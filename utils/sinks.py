@@ -0,0 +1,214 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import warnings
+from typing import IO, Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import supervision as sv
+
+_END = object()
+
+
+class FFmpegSink:
+    """
+    Writes frames to a video file through a local `ffmpeg` process, which
+    receives raw BGR frames over a pipe and encodes them with its own
+    threads. Same interface as `sv.VideoSink`.
+
+    Parameters:
+    -----------
+    target_path : str
+        Output video file.
+    video_info : sv.VideoInfo
+        Resolution and frame rate of the frames written.
+    codec : str
+        ffmpeg video encoder, e.g. `libx264`, `libx265` or `h264_nvenc`.
+    preset : str
+        Encoder speed/compression trade-off, e.g. `ultrafast` or `medium`.
+    crf : int
+        Constant rate factor: lower is better quality and bigger files.
+    output_wh : Optional[Tuple[int, int]]
+        Resolution of the encoded video, if different from the frames.
+    """
+
+    def __init__(
+        self,
+        target_path: str,
+        video_info: sv.VideoInfo,
+        codec: str = "libx264",
+        preset: str = "veryfast",
+        crf: int = 23,
+        output_wh: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        self.target_path = target_path
+        self.video_info = video_info
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.output_wh = output_wh
+        self._process: Optional[subprocess.Popen] = None
+        self._log: Optional[IO[bytes]] = None
+
+    def command(self) -> list:
+        width, height = self.video_info.resolution_wh
+        command = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}", "-r", str(self.video_info.fps),
+            "-i", "-",
+            "-an", "-c:v", self.codec, "-preset", self.preset, "-crf", str(self.crf),
+            "-pix_fmt", "yuv420p",
+        ]  # fmt: skip
+        if self.output_wh is not None and tuple(self.output_wh) != (width, height):
+            command += ["-vf", f"scale={self.output_wh[0]}:{self.output_wh[1]}"]
+        return command + [self.target_path]
+
+    def __enter__(self) -> "FFmpegSink":
+        # Messages go to a file rather than a pipe: nothing reads them until
+        # the end, and a full pipe would block ffmpeg and the writer thread
+        self._log = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            self.command(), stdin=subprocess.PIPE, stderr=self._log
+        )
+        return self
+
+    def write_frame(self, frame: np.ndarray) -> None:
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg stopped: {self._stderr()}") from None
+
+    def _stderr(self) -> str:
+        self._process.wait()
+        self._log.seek(0)
+        return self._log.read().decode(errors="replace").strip()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            if self._process.wait() != 0 and exc_type is None:
+                raise RuntimeError(f"ffmpeg failed: {self._stderr()}")
+        finally:
+            self._log.close()
+
+
+class OpenCVSink(sv.VideoSink):
+    """
+    `sv.VideoSink` that resizes frames to the resolution of its `video_info`
+    when they do not match it.
+    """
+
+    def write_frame(self, frame: np.ndarray) -> None:
+        if (frame.shape[1], frame.shape[0]) != self.video_info.resolution_wh:
+            frame = cv2.resize(
+                frame, self.video_info.resolution_wh, interpolation=cv2.INTER_AREA
+            )
+        super().write_frame(frame)
+
+
+class ThreadedSink:
+    """
+    Runs the `write_frame` calls of a sink on a writer thread fed by a
+    bounded queue, so encoding overlaps with the frame loop instead of
+    blocking it. The loop only waits when the queue is full. Errors of the
+    writer thread are raised by the next `write_frame` or on exit.
+    """
+
+    def __init__(self, sink: Any, queue_size: int = 8) -> None:
+        self.sink = sink
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while True:
+            frame = self.queue.get()
+            if frame is _END:
+                return
+            if self._error is None:
+                try:
+                    self.sink.write_frame(frame)
+                except BaseException as error:
+                    self._error = error
+
+    def __enter__(self) -> "ThreadedSink":
+        self.sink.__enter__()
+        self._thread.start()
+        return self
+
+    def write_frame(self, frame: np.ndarray) -> None:
+        if self._error is not None:
+            raise self._error
+        self.queue.put(frame)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.queue.put(_END)
+        self._thread.join()
+        self.sink.__exit__(exc_type, exc_value, traceback)
+        if self._error is not None and exc_type is None:
+            raise self._error
+
+
+def open_video_sink(
+    target_path: str,
+    video_info: sv.VideoInfo,
+    writer: str = "ffmpeg",
+    codec: str = "libx264",
+    preset: str = "veryfast",
+    crf: int = 23,
+    output_wh: Optional[Tuple[int, int]] = None,
+    queue_size: int = 8,
+) -> ThreadedSink:
+    """
+    Video sink encoding on its own thread: through `ffmpeg` when
+    `writer="ffmpeg"` and it is installed, otherwise through OpenCV. `codec`,
+    `preset` and `crf` only apply to ffmpeg.
+    """
+    if writer == "ffmpeg" and shutil.which("ffmpeg") is None:
+        warnings.warn("ffmpeg was not found on PATH, writing video with OpenCV")
+        writer = "cv2"
+    if writer == "ffmpeg":
+        sink = FFmpegSink(target_path, video_info, codec, preset, crf, output_wh)
+    else:
+        width, height = output_wh or video_info.resolution_wh
+        sink = OpenCVSink(target_path, sv.VideoInfo(width, height, video_info.fps))
+    return ThreadedSink(sink, queue_size)
+
+
+def concat_videos(source_paths: List[str], target_path: str) -> None:
+    """
+    Join videos of the same resolution and codec, e.g. the segments of a
+    checkpointed run, into `target_path`. With `ffmpeg` the streams are
+    copied without re-encoding, otherwise OpenCV decodes and re-encodes them.
+    """
+    if shutil.which("ffmpeg") is not None:
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+            for path in source_paths:
+                list_file.write(f"file '{os.path.abspath(path)}'\n")
+        try:
+            command = [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", list_file.name,
+                "-c", "copy", target_path,
+            ]  # fmt: skip
+            result = subprocess.run(command, stderr=subprocess.PIPE)
+        finally:
+            os.remove(list_file.name)
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg could not join the videos:\n{result.stderr.decode()}"
+            )
+        return
+    video_info = sv.VideoInfo.from_video_path(source_paths[0])
+    with sv.VideoSink(target_path, video_info) as sink:
+        for path in source_paths:
+            for frame in sv.get_video_frames_generator(path):
+                sink.write_frame(frame)
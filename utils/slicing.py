@@ -0,0 +1,107 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import supervision as sv
+
+from utils.roi import intersects_region
+
+BatchCallback = Callable[[List[np.ndarray]], List[sv.Detections]]
+
+
+class BatchedSlicer:
+    """
+    Tiled inference that sends every tile of one or more frames to the
+    detector in a single call, then shifts the boxes back into frame
+    coordinates and merges the overlapping tiles with NMS.
+
+    Tiles at the right and bottom borders are moved inwards so that every
+    tile has exactly `slice_wh` pixels, which keeps the batch uniform. When a
+    `region` is given, tiles that do not overlap it are never inferred.
+    """
+
+    def __init__(
+        self,
+        callback: BatchCallback,
+        slice_wh: Tuple[int, int] = (640, 640),
+        overlap_ratio_wh: Tuple[float, float] = (0.2, 0.2),
+        iou_threshold: float = 0.5,
+        region: Optional[np.ndarray] = None,
+    ) -> None:
+        self.callback = callback
+        self.slice_wh = slice_wh
+        self.overlap_ratio_wh = overlap_ratio_wh
+        self.iou_threshold = iou_threshold
+        self.region = region
+        self._offsets: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def tile_offsets(self, resolution_wh: Tuple[int, int]) -> np.ndarray:
+        """
+        Return the `(x_min, y_min, x_max, y_max)` of every tile for a frame
+        of the given resolution. Offsets are computed once per resolution.
+        """
+        if resolution_wh not in self._offsets:
+            xs = self._axis_starts(
+                resolution_wh[0], self.slice_wh[0], self.overlap_ratio_wh[0]
+            )
+            ys = self._axis_starts(
+                resolution_wh[1], self.slice_wh[1], self.overlap_ratio_wh[1]
+            )
+            x_min, y_min = np.meshgrid(xs, ys)
+            x_min, y_min = x_min.ravel(), y_min.ravel()
+            x_max = np.minimum(x_min + self.slice_wh[0], resolution_wh[0])
+            y_max = np.minimum(y_min + self.slice_wh[1], resolution_wh[1])
+            offsets = np.stack([x_min, y_min, x_max, y_max], axis=1)
+            if self.region is not None:
+                offsets = offsets[intersects_region(offsets, self.region)]
+            self._offsets[resolution_wh] = offsets
+        return self._offsets[resolution_wh]
+
+    @staticmethod
+    def _axis_starts(length: int, size: int, overlap_ratio: float) -> np.ndarray:
+        if length <= size:
+            return np.array([0])
+        stride = max(1, int(size * (1 - overlap_ratio)))
+        starts = np.arange(0, length - size, stride)
+        return np.append(starts, length - size)
+
+    def __call__(self, frame: np.ndarray) -> sv.Detections:
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(
+        self, frames: List[np.ndarray], regions: Optional[List[np.ndarray]] = None
+    ) -> List[sv.Detections]:
+        """
+        Detect on every frame. When `regions` holds boxes for each frame,
+        only the tiles overlapping one of them are inferred.
+        """
+        tiles = []
+        tile_offsets = []
+        for index, frame in enumerate(frames):
+            offsets = self.tile_offsets((frame.shape[1], frame.shape[0]))
+            if regions is not None:
+                offsets = offsets[
+                    np.any(
+                        [intersects_region(offsets, box) for box in regions[index]],
+                        axis=0,
+                    )
+                ]
+            tiles.extend(frame[y1:y2, x1:x2] for x1, y1, x2, y2 in offsets)
+            tile_offsets.append(offsets)
+
+        detections_in_tiles = self.callback(tiles) if tiles else []
+
+        detections_batch = []
+        start = 0
+        for offsets in tile_offsets:
+            frame_detections = []
+            for offset, detections in zip(
+                offsets, detections_in_tiles[start : start + len(offsets)]
+            ):
+                detections.xyxy = detections.xyxy + np.tile(offset[:2], 2)
+                frame_detections.append(detections)
+            start += len(offsets)
+            merged = sv.Detections.merge(frame_detections)
+            if len(merged) > 0:
+                merged = merged.with_nms(threshold=self.iou_threshold)
+            detections_batch.append(merged)
+        return detections_batch
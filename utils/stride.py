@@ -0,0 +1,122 @@
+from typing import Any, Callable, List, Optional
+
+import cv2
+import numpy as np
+import supervision as sv
+
+
+class KeyframeScheduler:
+    """
+    Decides on which frames the detector runs. With a fixed stride every
+    `stride`-th frame is a keyframe. In adaptive mode the stride shrinks
+    towards 1 while the scene is moving and grows back to `stride` while it
+    is still, using the fraction of changed pixels between consecutive
+    downscaled frames as the motion measure.
+    """
+
+    def __init__(
+        self,
+        stride: int = 1,
+        adaptive: bool = False,
+        motion_threshold: float = 0.02,
+        motion_width: int = 160,
+    ) -> None:
+        self.max_stride = max(1, stride)
+        self.adaptive = adaptive
+        self.motion_threshold = motion_threshold
+        self.motion_width = motion_width
+        self.stride = self.max_stride
+        self._since_keyframe = self.max_stride
+        self._previous: Optional[np.ndarray] = None
+
+    def _motion(self, frame: np.ndarray) -> float:
+        height = max(1, frame.shape[0] * self.motion_width // frame.shape[1])
+        small = cv2.resize(
+            frame, (self.motion_width, height), interpolation=cv2.INTER_AREA
+        )
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        previous, self._previous = self._previous, small
+        if previous is None:
+            return 0.0
+        return float(np.mean(cv2.absdiff(small, previous) > 25))
+
+    def is_keyframe(self, frame: np.ndarray) -> bool:
+        if self.adaptive:
+            if self._motion(frame) > self.motion_threshold:
+                self.stride = max(1, self.stride // 2)
+            else:
+                self.stride = min(self.max_stride, self.stride + 1)
+        if self._since_keyframe >= self.stride:
+            self._since_keyframe = 1
+            return True
+        self._since_keyframe += 1
+        return False
+
+    def detect_batch(
+        self,
+        frames: List[np.ndarray],
+        detect_batch: Callable[..., List[sv.Detections]],
+        keys: Optional[List[Any]] = None,
+    ) -> List[Optional[sv.Detections]]:
+        """
+        Run `detect_batch` on the keyframes among `frames` only. Frames that
+        are not keyframes get `None` in the result. With `keys`, e.g. frame
+        numbers, `detect_batch` also receives the keys of the keyframes.
+        """
+        keyframes = [self.is_keyframe(frame) for frame in frames]
+        selected = [frame for frame, keyframe in zip(frames, keyframes) if keyframe]
+        arguments = [selected]
+        if keys is not None:
+            arguments.append(
+                [key for key, keyframe in zip(keys, keyframes) if keyframe]
+            )
+        detections = iter(detect_batch(*arguments) if selected else [])
+        return [next(detections) if keyframe else None for keyframe in keyframes]
+
+
+class TrackPropagator:
+    """
+    Carries tracked boxes over the frames the detector skips. Each track
+    moves with the constant velocity measured between its last two
+    keyframes; tracks first seen on the last keyframe stay in place. Only
+    the arrays of the last keyframe are kept, not a copy of its detections.
+    """
+
+    def __init__(self) -> None:
+        self._xyxy = np.empty((0, 4))
+        self._tracker_id = np.array([], dtype=int)
+        self._confidence: Optional[np.ndarray] = None
+        self._class_id: Optional[np.ndarray] = None
+        self._velocity = np.zeros((0, 4))
+        self._elapsed = 0
+
+    def update(self, detections: sv.Detections) -> None:
+        """
+        Record the tracker output of a keyframe.
+        """
+        velocity = np.zeros((len(detections), 4))
+        if self._elapsed > 0:
+            _, new_idx, old_idx = np.intersect1d(
+                detections.tracker_id, self._tracker_id, return_indices=True
+            )
+            start = self._xyxy[old_idx] - self._velocity[old_idx] * (self._elapsed - 1)
+            velocity[new_idx] = (detections.xyxy[new_idx] - start) / self._elapsed
+        self._xyxy = detections.xyxy.copy()
+        self._tracker_id = detections.tracker_id
+        self._confidence = detections.confidence
+        self._class_id = detections.class_id
+        self._velocity = velocity
+        self._elapsed = 1
+
+    def predict(self) -> sv.Detections:
+        """
+        Advance every track by one frame and return the predicted boxes.
+        """
+        self._xyxy = self._xyxy + self._velocity
+        self._elapsed += 1
+        return sv.Detections(
+            xyxy=self._xyxy.copy(),
+            confidence=self._confidence,
+            class_id=self._class_id,
+            tracker_id=self._tracker_id,
+        )
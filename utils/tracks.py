@@ -0,0 +1,101 @@
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class TrackerIndex:
+    """
+    Maps tracker IDs to compact row numbers so per-track state can live in
+    NumPy arrays instead of dictionaries keyed by tracker ID.
+
+    Rows are assigned in order of first appearance; lookups go through a
+    sorted view of the IDs, so a whole frame of tracker IDs is resolved with
+    a single `np.searchsorted`.
+
+    With `max_lost_frames`, `observe` drops the rows of tracks that have not
+    been seen for more than that many frames, so the index stays bounded on
+    endless streams. It must be at least as long as the tracker keeps lost
+    tracks alive, otherwise a track could come back to a fresh row.
+    """
+
+    def __init__(self, max_lost_frames: Optional[int] = None) -> None:
+        self.max_lost_frames = max_lost_frames
+        self.frame_index = 0
+        self.evicted = np.empty(0, dtype=int)  # Tracker IDs dropped by the last observe
+        self.tracker_ids = np.empty(0, dtype=int)
+        self._sorter = np.empty(0, dtype=int)
+        self._columns: Dict[str, np.ndarray] = {}
+        self._fills: Dict[str, Any] = {}
+        self.add_column("last_seen", 0, int)
+
+    def __len__(self) -> int:
+        return len(self.tracker_ids)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name]
+
+    def add_column(self, name: str, fill: Any, dtype: type, width: int = None) -> None:
+        """
+        Register a per-track array. Rows of new tracks start at `fill`; with a
+        `width` the column holds `width` values per track.
+        """
+        shape = (len(self),) if width is None else (len(self), width)
+        self._columns[name] = np.full(shape, fill, dtype=dtype)
+        self._fills[name] = fill
+
+    def find(self, tracker_ids: np.ndarray) -> np.ndarray:
+        """
+        Row of every tracker ID, or -1 for IDs that are not indexed.
+        """
+        tracker_ids = np.asarray(tracker_ids, dtype=int)
+        if len(self) == 0:
+            return np.full(len(tracker_ids), -1, dtype=int)
+        sorted_ids = self.tracker_ids[self._sorter]
+        positions = np.searchsorted(sorted_ids, tracker_ids)
+        positions = np.minimum(positions, len(self) - 1)
+        found = sorted_ids[positions] == tracker_ids
+        return np.where(found, self._sorter[positions], -1)
+
+    def rows(self, tracker_ids: np.ndarray) -> np.ndarray:
+        """
+        Row of every tracker ID, adding rows for the IDs not seen before.
+        """
+        rows = self.find(tracker_ids)
+        missing = rows == -1
+        if np.any(missing):
+            new_ids = np.unique(np.asarray(tracker_ids, dtype=int)[missing])
+            count = len(new_ids)
+            self.tracker_ids = np.concatenate([self.tracker_ids, new_ids])
+            for name, column in self._columns.items():
+                grown = np.full(
+                    (count,) + column.shape[1:], self._fills[name], dtype=column.dtype
+                )
+                self._columns[name] = np.concatenate([column, grown])
+            self._sorter = np.argsort(self.tracker_ids, kind="stable")
+            rows = self.find(tracker_ids)
+        return rows
+
+    def observe(self, tracker_ids: np.ndarray) -> np.ndarray:
+        """
+        Rows of the tracker IDs present on the next frame. Marks them as seen
+        and evicts the tracks lost for longer than `max_lost_frames`.
+        """
+        if self.max_lost_frames is not None and len(self) > 0:
+            lost = self.frame_index - self["last_seen"] > self.max_lost_frames
+            lost &= ~np.isin(self.tracker_ids, tracker_ids)
+            self.evicted = self.tracker_ids[lost]
+            if len(self.evicted) > 0:
+                self.remove(~lost)
+        rows = self.rows(tracker_ids)
+        self["last_seen"][rows] = self.frame_index
+        self.frame_index += 1
+        return rows
+
+    def remove(self, keep: np.ndarray) -> None:
+        """
+        Keep only the rows where `keep` is True; remaining rows are renumbered.
+        """
+        self.tracker_ids = self.tracker_ids[keep]
+        for name, column in self._columns.items():
+            self._columns[name] = column[keep]
+        self._sorter = np.argsort(self.tracker_ids, kind="stable")
@@ -0,0 +1,576 @@
+import itertools
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+import supervision as sv
+from utils.checkpoint import (
+    get_state,
+    load_checkpoint,
+    save_checkpoint,
+    segment_path,
+    set_state,
+)
+from utils.counting import COLORS, ZoneCounter
+from utils.detection_cache import DetectionCache, cache_key
+from utils.frames import frame_range, read_frames, video_digest
+from utils.metrics import Metrics, instrument
+from utils.motion import MotionGate, bounding_region
+from utils.pipeline import (
+    batched,
+    chunked,
+    run_pipelined,
+    run_sequential,
+    unbatched,
+)
+from utils.reporting import CountsWriter
+from utils.roi import (
+    crop_to_region,
+    offset_detections,
+    scale_detections,
+    zones_region,
+)
+from utils.sinks import concat_videos, open_video_sink
+from utils.slicing import BatchedSlicer
+from utils.zones import (
+    JUNCTION_ZONES_IN,
+    JUNCTION_ZONES_OUT,
+    denormalize_polygons,
+    scale_resolution,
+)
+
+# Zones in normalized coordinates, scaled to the processing resolution
+ZONE_IN_POLYGONS = JUNCTION_ZONES_IN
+ZONE_OUT_POLYGONS = JUNCTION_ZONES_OUT  # red, green, yellow, blue
+
+# Corner dashboard: one box per out zone, with the counts of each in zone
+BOX_SIZE = 150  # width and height of the square boxes
+FONT = cv2.FONT_HERSHEY_SIMPLEX  # Font for text
+FONT_SCALE = 1
+THICKNESS = 2  # Thickness for both text and box lines
+
+Detector = Callable[[List[np.ndarray]], List[sv.Detections]]
+
+
+def dashboard_corners(width: int, height: int) -> Dict[str, Tuple[int, int]]:
+    # Coordinates for the four corners: North-West, North-East, South-East, South-West
+    return {
+        "North": (10, 10),
+        "East": (width - BOX_SIZE - 10, 10),
+        "South": (width - BOX_SIZE - 10, height - BOX_SIZE - 10),
+        "West": (10, height - BOX_SIZE - 10),
+    }
+
+
+class VideoProcessor(ZoneCounter):
+    """
+    Detection, tracking and counting of the vehicles crossing the junction
+    zones of a video, with the detector, the slicing and the dashboard
+    chosen by the caller.
+
+    Parameters:
+    -----------
+    load_detector : Callable[[], Detector]
+        Builds the detector, a callable returning the detections of a list
+        of frames, e.g. a `functools.partial` of a class of
+        `utils.detectors`. It is called once per process, so the processor
+        can be rebuilt in sharding workers without pickling a model.
+    source_video_path : str
+        Video to process.
+    slice_wh : Optional[Tuple[int, int]]
+        Detect on slices of this size, merged back into full-frame
+        detections, instead of on whole frames.
+    dashboard : bool
+        Draw a box per out zone in the corners of the frame, with the counts
+        of every in zone.
+    checkpoint_path : Optional[str]
+        Save the tracking and counting state, and how far the outputs got,
+        to this file every `checkpoint_interval` seconds of video. The
+        output video is then written in segments, joined at the end.
+    resume : bool
+        Continue from the checkpoint at `checkpoint_path`, if there is one,
+        with the same results as an uninterrupted run.
+    detection_cache_dir : Optional[str]
+        Keep the detections of every keyframe in a `DetectionCache` under
+        this directory, keyed by the video, the detector and its settings,
+        and read them back instead of detecting again on later runs.
+    """
+
+    def __init__(
+        self,
+        load_detector: Callable[[], Detector],
+        source_video_path: str,
+        target_video_path: str = None,
+        slice_wh: Tuple[int, int] = None,
+        dashboard: bool = False,
+        pipeline: bool = False,
+        queue_size: int = 4,
+        batch_size: int = 1,
+        roi_margin: int = None,
+        detect_stride: int = 1,
+        adaptive_stride: bool = False,
+        lost_track_buffer: int = 30,
+        headless: bool = False,
+        counts_path: str = "counts.jsonl",
+        metrics_port: int = None,
+        metrics_interval: float = None,
+        annotate_in_place: bool = True,
+        process_scale: float = 1.0,
+        full_resolution_output: bool = False,
+        writer: str = "ffmpeg",
+        codec: str = "libx264",
+        preset: str = "veryfast",
+        crf: int = 23,
+        encode_wh: Tuple[int, int] = None,
+        start: float = 0.0,
+        end: float = None,
+        stride: int = 1,
+        motion_gate: bool = False,
+        checkpoint_path: str = None,
+        checkpoint_interval: float = 300.0,
+        resume: bool = False,
+        detection_cache_dir: str = None,
+    ) -> None:
+        self.source_video_path = source_video_path
+        self.target_video_path = target_video_path
+        self.dashboard = dashboard
+        self.headless = headless
+        self.counts_path = counts_path
+        self.pipeline = pipeline
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.annotate_in_place = annotate_in_place
+        self.full_resolution_output = full_resolution_output
+        self.sink_options = dict(
+            writer=writer,
+            codec=codec,
+            preset=preset,
+            crf=crf,
+            output_wh=encode_wh,
+            queue_size=queue_size,
+        )
+
+        self.model = self.load_model(load_detector)
+
+        self.video_info = sv.VideoInfo.from_video_path(source_video_path)
+        # Source frames to process, and the rate at which they are processed
+        self.frames = frame_range(self.video_info, start, end, stride)
+        self.frame_rate = self.video_info.fps / stride
+        # Checkpoints are saved every this many processed frames, a whole
+        # number of batches so that checkpointing leaves the batches unchanged
+        self.checkpoint_frames = batch_size * max(
+            1, round(checkpoint_interval * self.frame_rate / batch_size)
+        )
+        # Frames are resized once after decode; detection, tracking and zones
+        # all work at `resolution_wh`, annotation at `output_wh`
+        self.resolution_wh = scale_resolution(
+            self.video_info.resolution_wh, process_scale
+        )
+        self.output_wh = (
+            self.video_info.resolution_wh
+            if full_resolution_output
+            else self.resolution_wh
+        )
+        zone_polygons = denormalize_polygons(
+            ZONE_IN_POLYGONS + ZONE_OUT_POLYGONS, self.resolution_wh
+        )
+        super().__init__(
+            zone_polygons[: len(ZONE_IN_POLYGONS)],
+            zone_polygons[len(ZONE_IN_POLYGONS) :],
+            self.resolution_wh,
+            self.frame_rate,
+            lost_track_buffer=lost_track_buffer,
+            detect_stride=detect_stride,
+            adaptive_stride=adaptive_stride,
+        )
+        # Zone outlines are only drawn, so they live at the output resolution
+        self.zones_in = denormalize_polygons(ZONE_IN_POLYGONS, self.output_wh)
+        self.zones_out = denormalize_polygons(ZONE_OUT_POLYGONS, self.output_wh)
+        self.roi = None
+        if roi_margin is not None:
+            self.roi = zones_region(zone_polygons, self.resolution_wh, roi_margin)
+        self.slicer = None
+        if slice_wh is not None:
+            self.slicer = BatchedSlicer(
+                callback=self.infer, slice_wh=tuple(slice_wh), region=self.roi
+            )
+        # Only moving areas and recent detections are sent to the detector
+        self.motion_gate = None
+        if motion_gate:
+            self.motion_gate = MotionGate(
+                self.resolution_wh, self.roi, hold=self.tracker.max_time_lost
+            )
+        # Detections only depend on the frame, except behind the motion gate,
+        # whose background model depends on the frames seen before
+        self.detection_cache = None
+        if detection_cache_dir is not None:
+            settings = dict(
+                video=video_digest(source_video_path),
+                detector=getattr(
+                    self.model, "cache_settings", type(self.model).__name__
+                ),
+                resolution_wh=self.resolution_wh,
+                roi=None if self.roi is None else self.roi.tolist(),
+                slice_wh=slice_wh,
+                motion_gate=motion_gate
+                and dict(
+                    start=self.frames.start,
+                    stride=stride,
+                    detect_stride=detect_stride,
+                    adaptive_stride=adaptive_stride,
+                ),
+            )
+            self.detection_cache = DetectionCache(
+                os.path.join(detection_cache_dir, cache_key(settings)), settings
+            )
+        # Stage timings are only hooked in when metrics are requested
+        self.metrics = Metrics(
+            enabled=metrics_port is not None or metrics_interval is not None,
+            port=metrics_port,
+            log_interval=metrics_interval,
+        )
+        instrument(self, self.metrics)
+
+    def load_model(self, load_detector: Callable[[], Detector]) -> Detector:
+        return load_detector()
+
+    def process_video(self):
+        checkpoint = None
+        if self.resume and self.checkpoint_path is not None:
+            checkpoint = self.load_checkpoint()
+        position = 0 if checkpoint is None else checkpoint["position"]
+
+        frame_generator = read_frames(self.source_video_path, self.frames[position:])
+        frame_generator = self.metrics.iterate(
+            "decode",
+            (self.prepare_frame(frame) for frame in frame_generator),
+            counter="decoded",
+        )
+        # With checkpoints, frames go through the stages in chunks, and every
+        # chunk is finished by all of them before its checkpoint is saved
+        chunks = [frame_generator]
+        if self.checkpoint_path is not None:
+            chunks = chunked(frame_generator, self.checkpoint_frames)
+
+        with self.metrics, tqdm(total=len(self.frames), initial=position) as progress:
+            if self.headless:
+                offset = None if checkpoint is None else checkpoint["counts_offset"]
+                with CountsWriter(self.counts_path, self.frames, offset) as writer:
+                    writer.frame_index = position
+                    for chunk in chunks:
+                        for events in self.run_stages(chunk, writer.frame_index):
+                            writer.write_events(events)
+                            progress.update()
+                            self.metrics.increment("completed")
+                        if self.checkpoint_path is not None:
+                            self.save_checkpoint(
+                                writer.frame_index, counts_offset=writer.tell()
+                            )
+                    writer.write_counts(self.detections_manager.snapshot())
+            elif self.target_video_path:
+                output_info = sv.VideoInfo(
+                    *self.output_wh, self.frame_rate, len(self.frames)
+                )
+                segments = [] if checkpoint is None else checkpoint["segments"]
+                sink = None
+                self.metrics.add_gauge(
+                    "queue_depth",
+                    lambda: sink.queue.qsize() if sink else 0,
+                    queue="encoder",
+                )
+                for chunk in chunks:
+                    # Every chunk of a checkpointed run is a segment of its own,
+                    # so a resumed run never has to append to a video file
+                    path = self.target_video_path
+                    if self.checkpoint_path is not None:
+                        path = segment_path(self.target_video_path, len(segments))
+                    with open_video_sink(
+                        path, output_info, **self.sink_options
+                    ) as sink:
+                        # Frames are encoded on the sink's own thread, timed there
+                        sink.sink.write_frame = self.metrics.wrap(
+                            "encoding", sink.sink.write_frame
+                        )
+                        for annotated_frame in self.run_stages(chunk, progress.n):
+                            sink.write_frame(annotated_frame)
+                            progress.update()
+                            self.metrics.increment("completed")
+                    if self.checkpoint_path is not None:
+                        segments.append(path)
+                        self.save_checkpoint(progress.n, segments=segments)
+                if self.checkpoint_path is not None:
+                    concat_videos(segments, self.target_video_path)
+                    for path in segments:
+                        os.remove(path)
+            else:
+                results = self.run_stages(frame_generator, position)
+                for annotated_frame in results:
+                    cv2.imshow("Processed Video", annotated_frame)
+                    progress.update()
+                    self.metrics.increment("completed")
+                    if cv2.waitKey(1) & 0xFF == ord("q"):
+                        break
+                results.close()
+                cv2.destroyAllWindows()
+        if self.detection_cache is not None:
+            self.detection_cache.flush()
+        if self.checkpoint_path is not None and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def run_stages(
+        self, frames: Iterable[Tuple[np.ndarray, np.ndarray]], position: int = 0
+    ) -> Iterator:
+        """
+        Detect, track, and then count or annotate `frames`, as returned by
+        `prepare_frame`, yielding the events or the annotated frame of each.
+        `frames` are those of `self.frames` from `position` on.
+        """
+        frame_batches = batched(frames, self.batch_size)
+        frame_indices = iter(self.frames[position:])
+
+        def detect(frames):
+            processed_frames = [processed for _, processed in frames]
+            indices = list(itertools.islice(frame_indices, len(frames)))
+            return self.detect_frames(processed_frames, indices)
+
+        if self.headless:
+            stages = [
+                detect,
+                lambda batch: [self.count_events(dets) for dets in batch],
+            ]
+        else:
+            stages = [
+                lambda frames: list(
+                    zip([frame for frame, _ in frames], detect(frames))
+                ),
+                lambda items: [(frame, *self.track(dets)) for frame, dets in items],
+                lambda items: [self.annotate_frame(*item) for item in items],
+            ]
+        if self.pipeline:
+            batches = run_pipelined(
+                frame_batches, stages, self.queue_size, self.metrics
+            )
+        else:
+            batches = run_sequential(frame_batches, stages)
+        return unbatched(batches)
+
+    def checkpoint_state(self) -> Dict[str, Dict[str, Any]]:
+        """
+        State of everything that carries information from one frame to the
+        next: the tracker, the keyframe schedule, the counting and the motion
+        gate.
+        """
+        state = super().checkpoint_state()
+        if self.motion_gate is not None:
+            # OpenCV background models cannot be saved: after a resume it is
+            # learnt again, starting from a keyframe detected in full
+            state["motion_gate"] = get_state(
+                self.motion_gate, exclude=("background", "_started")
+            )
+        return state
+
+    def save_checkpoint(self, position: int, **outputs: Any) -> None:
+        # Detections of the frames before the checkpoint are kept as well
+        if self.detection_cache is not None:
+            self.detection_cache.flush()
+        save_checkpoint(
+            self.checkpoint_path,
+            dict(
+                source_video_path=self.source_video_path,
+                frames=self.frames,
+                checkpoint_frames=self.checkpoint_frames,
+                position=position,
+                state=self.checkpoint_state(),
+                **outputs,
+            ),
+        )
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """
+        Restore the state saved at `checkpoint_path` and return the
+        checkpoint, or None when there is none yet.
+        """
+        checkpoint = load_checkpoint(self.checkpoint_path)
+        if checkpoint is None:
+            return None
+        saved_for = (
+            checkpoint["source_video_path"],
+            checkpoint["frames"],
+            checkpoint["checkpoint_frames"],
+        )
+        if saved_for != (self.source_video_path, self.frames, self.checkpoint_frames):
+            raise ValueError(
+                f"Checkpoint {self.checkpoint_path} was saved for another video, "
+                "frame range or checkpoint interval"
+            )
+        for name, state in checkpoint["state"].items():
+            set_state(getattr(self, name), state)
+        return checkpoint
+
+    def prepare_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the frame to annotate and the frame to process, both resized
+        once from the decoded one.
+        """
+        processed = frame
+        if (frame.shape[1], frame.shape[0]) != self.resolution_wh:
+            processed = cv2.resize(
+                frame, self.resolution_wh, interpolation=cv2.INTER_AREA
+            )
+        return (frame if self.full_resolution_output else processed), processed
+
+    def draw_static(self, scene: np.ndarray) -> np.ndarray:
+        scene = super().draw_static(scene)
+        if self.dashboard:
+            scene = self.draw_dashboard(scene)
+        return scene
+
+    def draw_dashboard(self, scene: np.ndarray) -> np.ndarray:
+        height, width, _ = scene.shape
+        color = (255, 255, 255)  # White boxes
+
+        # Draw the boxes and text in each corner
+        for direction, (x, y) in dashboard_corners(width, height).items():
+            # Draw the rectangle
+            cv2.rectangle(scene, (x, y), (x + BOX_SIZE, y + BOX_SIZE), color, -1)
+            # Put the direction text in the superior part of the box
+            text_size = cv2.getTextSize(direction, FONT, FONT_SCALE, THICKNESS)[0]
+            text_x = x + (BOX_SIZE - text_size[0]) // 2  # Center horizontally
+            text_y = y + text_size[1] + 5  # 5 pixels margin from the top
+            cv2.putText(
+                scene,
+                direction,
+                (text_x, text_y),
+                FONT,
+                FONT_SCALE,
+                (0, 0, 0),
+                THICKNESS,
+            )
+        return scene
+
+    def draw_dashboard_counts(
+        self, scene: np.ndarray, counts: Dict[int, Dict[int, int]]
+    ) -> np.ndarray:
+        height, width, _ = scene.shape
+        corners = list(dashboard_corners(width, height).values())
+        for zone_out_id, zone_counts in counts.items():
+            x, y = corners[zone_out_id]
+            for i, (zone_in_id, count) in enumerate(zone_counts.items()):
+                text_size = cv2.getTextSize(str(count), FONT, FONT_SCALE, THICKNESS)[0]
+                text_x = x + 10 + i * (text_size[0] + 10)
+                # 5 pixels margin from the bottom
+                text_y = (y + BOX_SIZE) - text_size[1] - 5
+                color = COLORS.by_idx(zone_in_id)
+                cv2.putText(
+                    scene,
+                    str(count),
+                    (text_x, text_y),
+                    FONT,
+                    FONT_SCALE,
+                    (color.b, color.g, color.r),
+                    THICKNESS,
+                )
+        return scene
+
+    def annotate_frame(
+        self,
+        frame: np.ndarray,
+        detections: sv.Detections,
+        counts: Dict[int, Dict[int, int]] = None,
+    ) -> np.ndarray:
+        if counts is None:
+            counts = self.detections_manager.snapshot()
+
+        # Decoded frames are not used after annotation, so by default they are
+        # drawn on directly instead of copying a full-resolution buffer
+        if not self.annotate_in_place:
+            frame = frame.copy()
+        if self.output_wh != self.resolution_wh:
+            detections = scale_detections(
+                detections,
+                (
+                    self.output_wh[0] / self.resolution_wh[0],
+                    self.output_wh[1] / self.resolution_wh[1],
+                ),
+            )
+        annotated_frame = super().annotate_frame(frame, detections, counts)
+        if self.dashboard:
+            annotated_frame = self.draw_dashboard_counts(annotated_frame, counts)
+
+        return annotated_frame
+
+    def infer(self, images: List[np.ndarray]) -> List[sv.Detections]:
+        return self.model(images)
+
+    def detect_batch(
+        self, frames: List[np.ndarray], regions: Optional[List[np.ndarray]] = None
+    ) -> List[sv.Detections]:
+        if self.slicer is not None:
+            return self.slicer.detect_batch(frames, regions)
+        # Every frame is cropped to the ROI, or to the bounding region of the
+        # boxes the motion gate selected on it
+        crops = [self.roi] * len(frames)
+        if regions is not None:
+            crops = [bounding_region(boxes) for boxes in regions]
+        frames = [
+            frame if crop is None else crop_to_region(frame, crop)
+            for frame, crop in zip(frames, crops)
+        ]
+        detections_batch = self.infer(frames)
+        for detections, crop in zip(detections_batch, crops):
+            if crop is not None:
+                offset_detections(detections, crop)
+        return detections_batch
+
+    def detect_keyframes(self, frames: List[np.ndarray]) -> List[sv.Detections]:
+        if self.motion_gate is None:
+            return self.detect_batch(frames)
+        return self.motion_gate.detect_batch(frames, self.detect_batch)
+
+    def detect_frames(
+        self, frames: List[np.ndarray], frame_indices: List[int]
+    ) -> List[Optional[sv.Detections]]:
+        """
+        Detections of the keyframes among `frames`, the frames numbered
+        `frame_indices` in the source video, and None for the other frames.
+        """
+        if self.detection_cache is None:
+            return self.scheduler.detect_batch(frames, self.detect_keyframes)
+        return self.scheduler.detect_batch(
+            frames, self.detect_cached, keys=frame_indices
+        )
+
+    def detect_cached(
+        self, frames: List[np.ndarray], frame_indices: List[int]
+    ) -> List[sv.Detections]:
+        detections_batch = [self.detection_cache.get(i) for i in frame_indices]
+        missing = [i for i, dets in enumerate(detections_batch) if dets is None]
+        if self.motion_gate is not None:
+            # The gate still sees every frame, as `MotionGate.detect_batch`
+            # does, and a batch is detected whole unless it is all cached
+            if not missing:
+                for frame in frames:
+                    self.motion_gate.regions(frame)
+                for detections in detections_batch:
+                    self.motion_gate.observe(detections)
+                return detections_batch
+            missing = list(range(len(frames)))
+        if missing:
+            detected = self.detect_keyframes([frames[i] for i in missing])
+            for i, detections in zip(missing, detected):
+                self.detection_cache.put(frame_indices[i], detections)
+                detections_batch[i] = detections
+        return detections_batch
+
+    def detect(self, frame: np.ndarray) -> sv.Detections:
+        return self.detect_batch([frame])[0]
+
+    def process_frame(self, frame: np.ndarray) -> np.ndarray:
+        frame, processed = self.prepare_frame(frame)
+        detections, counts = self.track(self.detect(processed))
+        return self.annotate_frame(frame, detections, counts)
@@ -0,0 +1,99 @@
+from typing import List, Tuple
+
+import numpy as np
+import supervision as sv
+
+# The four approaches of the junction, as fractions of the frame width and
+# height so the same zones fit any resolution the video is processed at
+JUNCTION_ZONES_IN = [
+    np.array([[0.3396, 0.1981], [0.4143, 0.0574], [0.4935, 0.1903], [0.4188, 0.3310]]),
+    np.array([[0.6641, 0.3556], [0.7388, 0.2148], [0.8180, 0.3477], [0.7432, 0.4884]]),
+    np.array([[0.5872, 0.8644], [0.6620, 0.7236], [0.7411, 0.8565], [0.6664, 0.9972]]),
+    np.array([[0.2490, 0.6972], [0.3237, 0.5565], [0.4029, 0.6894], [0.3281, 0.8301]]),
+]
+
+JUNCTION_ZONES_OUT = [
+    np.array([[0.3242, 0.5144], [0.3990, 0.3736], [0.3198, 0.2407], [0.2451, 0.3815]]),
+    np.array([[0.5479, 0.1519], [0.6227, 0.0111], [0.7018, 0.1440], [0.6271, 0.2847]]),
+    np.array([[0.6781, 0.6981], [0.7529, 0.5574], [0.8320, 0.6903], [0.7573, 0.8310]]),
+    np.array([[0.3409, 0.8620], [0.4156, 0.7213], [0.4948, 0.8542], [0.4201, 0.9949]]),
+]
+
+
+def scale_resolution(resolution_wh: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    """
+    Frame size after resizing by `scale`.
+    """
+    return (
+        max(1, int(round(resolution_wh[0] * scale))),
+        max(1, int(round(resolution_wh[1] * scale))),
+    )
+
+
+def denormalize_polygons(
+    polygons: List[np.ndarray], resolution_wh: Tuple[int, int]
+) -> List[np.ndarray]:
+    """
+    Convert polygons given as fractions of the frame size to pixel
+    coordinates of a frame of `resolution_wh`.
+    """
+    return [
+        np.rint(np.asarray(polygon) * resolution_wh).astype(int)
+        for polygon in polygons
+    ]
+
+
+class ZoneIndex:
+    """
+    All zones of a frame rasterized once into a label map, where bit `i` of
+    a pixel is set when the pixel lies inside polygon `i`. Membership of
+    every detection in every zone is then a single gather at the detection
+    anchors, instead of one `PolygonZone.trigger` call per zone.
+
+    Parameters:
+    -----------
+    polygons : List[np.ndarray]
+        Zone polygons in frame coordinates, at most 64.
+    resolution_wh : Tuple[int, int]
+        Frame width and height.
+    triggering_anchor : sv.Position
+        Point of the box that has to be inside a zone, as in `sv.PolygonZone`.
+    """
+
+    def __init__(
+        self,
+        polygons: List[np.ndarray],
+        resolution_wh: Tuple[int, int],
+        triggering_anchor: sv.Position = sv.Position.CENTER,
+    ) -> None:
+        if len(polygons) > 64:
+            raise ValueError(f"ZoneIndex supports up to 64 zones, got {len(polygons)}")
+        dtype = next(
+            dtype
+            for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+            if np.iinfo(dtype).bits >= len(polygons)
+        )
+        self.polygons = polygons
+        self.triggering_anchor = triggering_anchor
+        self.label_map = np.zeros((resolution_wh[1], resolution_wh[0]), dtype=dtype)
+        for i, polygon in enumerate(polygons):
+            mask = sv.polygon_to_mask(polygon=polygon, resolution_wh=resolution_wh)
+            self.label_map[mask.astype(bool)] |= dtype(1 << i)
+        self._bits = np.arange(len(polygons), dtype=dtype)
+
+    def trigger(self, detections: sv.Detections) -> np.ndarray:
+        """
+        Boolean array of shape (detections, zones), True where the anchor of
+        the detection lies inside the zone.
+        """
+        if len(detections) == 0:
+            return np.zeros((0, len(self.polygons)), dtype=bool)
+        anchors = np.rint(
+            detections.get_anchors_coordinates(self.triggering_anchor)
+        ).astype(int)
+        height, width = self.label_map.shape
+        x, y = anchors[:, 0], anchors[:, 1]
+        in_frame = (x >= 0) & (y >= 0) & (x < width) & (y < height)
+        labels = self.label_map[np.clip(y, 0, height - 1), np.clip(x, 0, width - 1)]
+        labels[~in_frame] = 0
+        return ((labels[:, None] >> self._bits) & 1).astype(bool)
@@ -0,0 +1,112 @@
+import argparse
+from functools import partial
+from typing import Any, List, Optional
+
+# PRESETS is imported from here by the original single-purpose scripts
+from utils.cli import PRESETS, detector_factory, parse_args  # noqa: F401
+
+
+def main(argv: Optional[List[str]] = None, **defaults: Any) -> None:
+    args = parse_args(argv, **defaults)
+
+    if args.config_path is not None:
+        run_streams(args)
+        return
+
+    from utils.sharding import process_sharded
+    from utils.video_processor import VideoProcessor
+
+    batch_size = args.batch_size
+    if args.detector == "roboflow" and args.inference_server is not None:
+        # Every image of a detector call is in flight at once, so batch at
+        # least as many frames as may be outstanding
+        batch_size = max(batch_size, args.max_in_flight)
+
+    processor_factory = partial(
+        VideoProcessor,
+        load_detector=detector_factory(args),
+        source_video_path=args.source_video_path,
+        target_video_path=args.target_video_path,
+        slice_wh=args.slice_wh,
+        dashboard=args.dashboard,
+        headless=args.headless,
+        counts_path=args.counts_path,
+        pipeline=args.pipeline,
+        queue_size=args.queue_size,
+        batch_size=batch_size,
+        roi_margin=args.roi_margin,
+        detect_stride=args.detect_stride,
+        adaptive_stride=args.adaptive_stride,
+        lost_track_buffer=args.lost_track_buffer,
+        metrics_port=args.metrics_port,
+        metrics_interval=args.metrics_interval,
+        process_scale=args.process_scale,
+        full_resolution_output=args.full_resolution_output,
+        writer=args.writer,
+        codec=args.codec,
+        preset=args.preset,
+        crf=args.crf,
+        encode_wh=args.encode_wh,
+        start=args.start,
+        end=args.end,
+        stride=args.stride,
+        motion_gate=args.motion_gate,
+        checkpoint_path=args.checkpoint_path,
+        checkpoint_interval=args.checkpoint_interval,
+        resume=args.resume,
+        detection_cache_dir=args.detection_cache,
+    )
+    if args.workers > 1:
+        process_sharded(
+            processor_factory,
+            args.source_video_path,
+            args.workers,
+            args.shard_overlap,
+            args.counts_path,
+            start=args.start,
+            end=args.end,
+            stride=args.stride,
+        )
+    else:
+        processor_factory().process_video()
+
+
+def run_streams(args: argparse.Namespace) -> None:
+    """
+    Serve every stream of `--config_path` with one detector.
+    """
+    from utils.multistream import MultiStreamRunner, load_streams
+
+    streams = load_streams(
+        args.config_path,
+        headless=args.headless,
+        start=args.start,
+        end=args.end,
+        stride=args.stride,
+        lost_track_buffer=args.lost_track_buffer,
+        detect_stride=args.detect_stride,
+        adaptive_stride=args.adaptive_stride,
+        process_scale=args.process_scale,
+    )
+    load_detector = detector_factory(args, streams[0].source_video_path)
+    runner = MultiStreamRunner(
+        load_detector(),
+        streams,
+        sink_options=dict(
+            writer=args.writer,
+            codec=args.codec,
+            preset=args.preset,
+            crf=args.crf,
+            output_wh=args.encode_wh,
+            queue_size=args.queue_size,
+        ),
+        detection_cache_dir=args.detection_cache,
+        checkpoint_path=args.checkpoint_path,
+        checkpoint_interval=args.checkpoint_interval,
+        resume=args.resume,
+    )
+    runner.run(pipeline=args.pipeline, queue_size=args.queue_size)
+
+
+if __name__ == "__main__":
+    main()